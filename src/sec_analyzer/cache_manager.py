@@ -1,16 +1,121 @@
 """SQLite cache manager for SEC data."""
 
 import aiosqlite
-import json
-import hashlib
+import asyncio
 import gzip
+import math
+import orjson
+import os
+import re
+import shutil
+import threading
 import time
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
+import xxhash
+import zstandard as zstd
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional, Dict, Any, AsyncIterator, List, Tuple
 from pathlib import Path
 
 from .config import Config
 
+# Codec tags stored in the ``is_compressed`` column. Rows written before zstd
+# support hold FALSE/TRUE, which map onto raw and gzip respectively.
+CODEC_RAW = 0
+CODEC_GZIP = 1
+CODEC_ZSTD = 2
+
+# Payloads smaller than this are stored raw; compressing them costs more CPU
+# than the few bytes it saves
+COMPRESSION_MIN_BYTES = 256
+
+# zstd level per payload kind: metadata is written on every fetch so it favours
+# speed, analysis results are small and long-lived so they favour ratio
+COMPRESSION_LEVELS = {
+    "metadata": 1,
+    "content": 3,
+    "analysis": 6,
+}
+
+# Bumped whenever _migrate_schema needs to rewrite existing data
+SCHEMA_VERSION = 5
+
+# Ticker lookups are the hottest cache query and rows are tiny, so the table
+# is clustered on its primary key instead of keeping a separate rowid B-tree.
+COMPANY_CIKS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS company_ciks (
+        ticker TEXT PRIMARY KEY,
+        cik TEXT NOT NULL,
+        cached_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+    ) WITHOUT ROWID
+"""
+
+# Matches json.dumps' handling of int/float dict keys when serializing
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+# Characters that are not safe in a document file path component
+_UNSAFE_PATH_CHARS = re.compile(r'[^A-Za-z0-9._-]')
+
+# Response times are kept as an integer microsecond sum; averages and hit
+# rates are derived only when the statistics are read
+CACHE_PERFORMANCE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cache_performance (
+        operation TEXT,
+        cache_hits INTEGER DEFAULT 0,
+        cache_misses INTEGER DEFAULT 0,
+        total_requests INTEGER DEFAULT 0,
+        total_response_time_us INTEGER DEFAULT 0,
+        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (operation)
+    )
+"""
+
+# Most free pages a single cleanup returns to the filesystem
+INCREMENTAL_VACUUM_PAGES = 1000
+
+# Fixed statement text per table so every statement stays in sqlite3's
+# prepared-statement cache (a table name can't be a bound parameter).
+# Sub-analysis rows share analysis_results under a ``report_type:kind`` key
+# and are counted separately from the analyses they feed.
+TABLE_COUNTS_QUERY = """
+    SELECT
+        (SELECT COUNT(*) FROM company_ciks),
+        (SELECT COUNT(*) FROM filing_metadata),
+        (SELECT COUNT(*) FROM document_content),
+        (SELECT COUNT(*) FROM analysis_results WHERE instr(report_type, ':') = 0),
+        (SELECT COUNT(*) FROM analysis_results WHERE instr(report_type, ':') > 0)
+"""
+TABLE_COUNT_NAMES = ("company_ciks", "filing_metadata", "document_content", "analysis_results", "sub_analysis")
+CLEAR_TABLE_STATEMENTS = {
+    "company_ciks": "DELETE FROM company_ciks",
+    "filing_metadata": "DELETE FROM filing_metadata",
+    "document_content": "DELETE FROM document_content",
+    "analysis_results": "DELETE FROM analysis_results",
+    "cache_performance": "DELETE FROM cache_performance",
+}
+
+# Statements kept prepared on the shared connection (sqlite3 defaults to 128)
+STATEMENT_CACHE_SIZE = 256
+
+# How often buffered cache statistics are written to the database
+STATS_FLUSH_INTERVAL_SECONDS = 30
+
+# The cache size limit is checked once every this many writes
+SIZE_CHECK_INTERVAL = 64
+
+# Eviction frees space until the cache is back under this share of the limit
+EVICTION_TARGET_RATIO = 0.9
+
+# Payloads at least this large are (de)compressed in a worker thread so
+# they don't stall the event loop
+OFFLOAD_THRESHOLD = 64 * 1024
+
+# Entry caps for the in-process LRU layers in front of SQLite; metadata
+# entries hold whole report lists so they get a smaller cap
+CIK_MEMORY_CACHE_SIZE = 1024
+METADATA_MEMORY_CACHE_SIZE = 128
+
 
 class CacheManager:
     """Manages SQLite cache for SEC data to avoid repeated downloads."""
@@ -25,215 +130,552 @@ class CacheManager:
         self.cache_hits = 0
         self.cache_misses = 0
         
+        self.dict_path = config.cache_dict_path
+        self.docs_dir = Path(config.cache_docs_dir)
+        self._db: Optional[aiosqlite.Connection] = None
+        # Serializes initialize() for components sharing this manager
+        self._init_lock = asyncio.Lock()
+        # Serializes writers on the shared connection; held by transaction()
+        self._write_lock = asyncio.Lock()
+        # Task whose transaction() is open; its nested writes join it
+        self._transaction_owner: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        # operation -> [hits, misses, total response time in us]
+        self._perf_buffer: Dict[str, List] = {}
+        # primary key -> [access count, last access time] for cache hits
+        self._document_access_buffer: Dict[Tuple[str, str, str], List[int]] = {}
+        self._analysis_access_buffer: Dict[Tuple[str, str, str], List[int]] = {}
+        self._write_count = 0
+        self._page_size = 4096
+        
+        # In-process LRU layers: key -> (value, expiry timestamp)
+        self._cik_mem: OrderedDict[str, Tuple[str, float]] = OrderedDict()
+        self._metadata_mem: OrderedDict[Tuple[str, str], Tuple[List[Dict], float]] = OrderedDict()
+        # operation -> hits served from memory without touching SQLite
+        self._memory_hits: Dict[str, int] = {}
+        
+        # Reusable zstd contexts avoid re-allocating codec state per call
+        self._codec_local = threading.local()
+        self._codec_generation = 0
+        self._load_compression_dictionary()
+        
     async def initialize(self):
         """Initialize the cache database with required tables."""
+        if not self.cache_enabled or self._db is not None:
+            return
+        
+        async with self._init_lock:
+            if self._db is None:
+                await self._open_database()
+    
+    async def _open_database(self):
+        """Open, migrate and set up the cache database connection."""
+        # A single long-lived connection avoids a thread spawn and PRAGMA
+        # setup per cache call; aiosqlite serializes its use across coroutines.
+        db = await aiosqlite.connect(self.db_path, cached_statements=STATEMENT_CACHE_SIZE)
+        # Must run before WAL is enabled, which fixes the mode on a new database
+        await self._enable_incremental_vacuum(db)
+        await self._configure_connection(db)
+        
+        # The page size is fixed for the life of the database file
+        cursor = await db.execute("PRAGMA page_size")
+        self._page_size = (await cursor.fetchone())[0]
+        
+        # Check if we need to migrate the schema
+        await self._migrate_schema(db)
+        
+        # Company CIK cache table
+        await db.execute(COMPANY_CIKS_SCHEMA)
+        
+        # SEC filings metadata cache
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS filing_metadata (
+                ticker TEXT,
+                report_type TEXT,
+                data_hash TEXT,
+                metadata_json TEXT NOT NULL,
+                is_compressed INTEGER DEFAULT 0,
+                cached_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                PRIMARY KEY (ticker, report_type, data_hash)
+            )
+        """)
+        
+        # SEC document content index; the compressed bodies live in files
+        # under docs_dir so the database stays small
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS document_content (
+                cik TEXT,
+                accession_number TEXT,
+                primary_document TEXT,
+                content_path TEXT NOT NULL,
+                content_length INTEGER,
+                stored_size INTEGER,
+                is_compressed INTEGER DEFAULT 0,
+                cached_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                access_count INTEGER DEFAULT 1,
+                last_accessed INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                PRIMARY KEY (cik, accession_number, primary_document)
+            )
+        """)
+        
+        # Analysis results cache with compression
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_results (
+                ticker TEXT,
+                report_type TEXT,
+                content_hash TEXT,
+                analysis_json BLOB NOT NULL,
+                is_compressed INTEGER DEFAULT 0,
+                cached_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                access_count INTEGER DEFAULT 1,
+                last_accessed INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                PRIMARY KEY (ticker, report_type, content_hash)
+            )
+        """)
+        
+        # Cache performance tracking table
+        await db.execute(CACHE_PERFORMANCE_SCHEMA)
+        
+        # Create indexes for better performance
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_filing_metadata_ticker ON filing_metadata(ticker)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_document_content_cik ON document_content(cik)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_analysis_ticker ON analysis_results(ticker)")
+        
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_company_ciks_cached ON company_ciks(cached_at)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_filing_metadata_cached ON filing_metadata(cached_at)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_document_content_cached ON document_content(cached_at)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cached ON analysis_results(cached_at)")
+        
+        # _migrate_schema guarantees the last_accessed columns exist
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_document_content_accessed ON document_content(last_accessed)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_analysis_accessed ON analysis_results(last_accessed)")
+        
+        await db.commit()
+        
+        # Publish the connection only once it is fully set up
+        self._db = db
+        self._flush_task = asyncio.create_task(self._flush_periodically())
+    
+    async def _get_db(self) -> aiosqlite.Connection:
+        """Return the shared cache connection, initializing it on first use."""
+        if self._db is None:
+            await self.initialize()
+        return self._db
+    
+    async def close(self):
+        """Flush buffered statistics and close the cache database connection."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        
+        if self._db is not None:
+            try:
+                await self.flush_stats()
+            except Exception:
+                pass  # Ignore errors in statistics tracking
+            await self._db.close()
+            self._db = None
+    
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        """Group the cache writes made inside the block into one transaction.
+        
+        Writes commit together when the block exits and roll back if it
+        raises. Transactions from different tasks run one at a time; blocks
+        nested in the same task join the outermost transaction.
+        """
         if not self.cache_enabled:
+            yield
             return
         
-        async with aiosqlite.connect(self.db_path) as db:
-            # Check if we need to migrate the schema
-            await self._migrate_schema(db)
-            
-            # Company CIK cache table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS company_ciks (
-                    ticker TEXT PRIMARY KEY,
-                    cik TEXT NOT NULL,
-                    cached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # SEC filings metadata cache
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS filing_metadata (
-                    ticker TEXT,
-                    report_type TEXT,
-                    data_hash TEXT,
-                    metadata_json TEXT NOT NULL,
-                    cached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (ticker, report_type, data_hash)
-                )
-            """)
-            
-            # SEC document content cache with compression support
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS document_content (
-                    cik TEXT,
-                    accession_number TEXT,
-                    primary_document TEXT,
-                    content BLOB NOT NULL,
-                    content_length INTEGER,
-                    is_compressed BOOLEAN DEFAULT FALSE,
-                    cached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    access_count INTEGER DEFAULT 1,
-                    last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (cik, accession_number, primary_document)
-                )
-            """)
-            
-            # Analysis results cache with compression
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS analysis_results (
-                    ticker TEXT,
-                    report_type TEXT,
-                    content_hash TEXT,
-                    analysis_json BLOB NOT NULL,
-                    is_compressed BOOLEAN DEFAULT FALSE,
-                    cached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    access_count INTEGER DEFAULT 1,
-                    last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (ticker, report_type, content_hash)
-                )
-            """)
-            
-            # Cache performance tracking table
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS cache_performance (
-                    operation TEXT,
-                    cache_hits INTEGER DEFAULT 0,
-                    cache_misses INTEGER DEFAULT 0,
-                    total_requests INTEGER DEFAULT 0,
-                    avg_response_time_ms REAL DEFAULT 0,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (operation)
-                )
-            """)
-            
-            # Create indexes for better performance
-            await db.execute("CREATE INDEX IF NOT EXISTS idx_filing_metadata_ticker ON filing_metadata(ticker)")
-            await db.execute("CREATE INDEX IF NOT EXISTS idx_document_content_cik ON document_content(cik)")
-            await db.execute("CREATE INDEX IF NOT EXISTS idx_analysis_ticker ON analysis_results(ticker)")
-            
-            # Only create these indexes if the columns exist
+        task = asyncio.current_task()
+        if self._transaction_owner is task:
+            yield
+            return
+        
+        db = await self._get_db()
+        async with self._write_lock:
+            await db.execute("BEGIN IMMEDIATE")
+            self._transaction_owner = task
             try:
-                await db.execute("CREATE INDEX IF NOT EXISTS idx_document_content_accessed ON document_content(last_accessed)")
-                await db.execute("CREATE INDEX IF NOT EXISTS idx_analysis_accessed ON analysis_results(last_accessed)")
-            except:
-                pass  # Columns don't exist yet, will be added in migration
+                yield
+            except BaseException:
+                await db.rollback()
+                raise
+            else:
+                await db.commit()
+            finally:
+                self._transaction_owner = None
+    
+    async def _configure_connection(self, db):
+        """Apply journal and performance PRAGMAs to a connection."""
+        try:
+            # WAL is persistent in the database file, so setting it once at init
+            # lets readers run concurrently with writers on every later connection.
+            await db.execute("PRAGMA journal_mode=WAL")
+            # With WAL, NORMAL only fsyncs at checkpoints instead of every commit
+            await db.execute("PRAGMA synchronous=NORMAL")
+            await db.execute("PRAGMA temp_store=MEMORY")
+            await db.execute("PRAGMA mmap_size=268435456")  # 256 MB
+            await db.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache
+        except Exception:
+            pass  # Read-only or network filesystems may reject WAL; keep defaults
+    
+    async def _enable_incremental_vacuum(self, db):
+        """Switch the database to incremental auto-vacuum.
+        
+        New databases pick the mode up before any table is created; existing
+        ones need a one-time VACUUM to rebuild in the new mode.
+        """
+        try:
+            cursor = await db.execute("PRAGMA auto_vacuum")
+            if (await cursor.fetchone())[0] == 2:  # INCREMENTAL
+                return
             
-            await db.commit()
+            await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            cursor = await db.execute("SELECT COUNT(*) FROM sqlite_master")
+            if (await cursor.fetchone())[0]:
+                await db.execute("VACUUM")
+        except Exception:
+            pass  # Keep the current mode; cleanup still works without reclaiming space
     
     async def _migrate_schema(self, db):
         """Migrate database schema to latest version."""
         try:
-            # Check if we need to add new columns to existing tables
-            cursor = await db.execute("PRAGMA table_info(document_content)")
-            columns = await cursor.fetchall()
-            column_names = [col[1] for col in columns]
+            cursor = await db.execute("PRAGMA user_version")
+            version = (await cursor.fetchone())[0]
+            if version >= SCHEMA_VERSION:
+                return
+            
+            cursor = await db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            tables = {row[0] for row in await cursor.fetchall()}
+            
+            # Add missing columns to existing content tables
+            for table in ("document_content", "analysis_results"):
+                if table not in tables:
+                    continue
+                cursor = await db.execute(f"PRAGMA table_info({table})")
+                column_names = [col[1] for col in await cursor.fetchall()]
+                
+                if 'is_compressed' not in column_names:
+                    await db.execute(f"ALTER TABLE {table} ADD COLUMN is_compressed INTEGER DEFAULT 0")
+                if 'access_count' not in column_names:
+                    await db.execute(f"ALTER TABLE {table} ADD COLUMN access_count INTEGER DEFAULT 1")
+                if 'last_accessed' not in column_names:
+                    await db.execute(f"ALTER TABLE {table} ADD COLUMN last_accessed INTEGER")
+            
+            if version < 1:
+                # Version 1 stores timestamps as unix seconds instead of text
+                for table in ("company_ciks", "filing_metadata", "document_content", "analysis_results"):
+                    if table in tables:
+                        await db.execute(
+                            f"UPDATE {table} SET cached_at = CAST(strftime('%s', cached_at) AS INTEGER) WHERE typeof(cached_at) = 'text'"
+                        )
+                for table in ("document_content", "analysis_results"):
+                    if table in tables:
+                        await db.execute(
+                            f"UPDATE {table} SET last_accessed = COALESCE(CAST(strftime('%s', last_accessed) AS INTEGER), cached_at) "
+                            "WHERE typeof(last_accessed) != 'integer'"
+                        )
+            
+            if version < 2 and "company_ciks" in tables:
+                # Version 2 rebuilds company_ciks as a WITHOUT ROWID table
+                await db.execute("ALTER TABLE company_ciks RENAME TO company_ciks_old")
+                await db.execute(COMPANY_CIKS_SCHEMA)
+                await db.execute(
+                    "INSERT OR REPLACE INTO company_ciks (ticker, cik, cached_at) SELECT ticker, cik, cached_at FROM company_ciks_old"
+                )
+                await db.execute("DROP TABLE company_ciks_old")
             
-            # Add missing columns to document_content
-            if 'is_compressed' not in column_names:
-                await db.execute("ALTER TABLE document_content ADD COLUMN is_compressed BOOLEAN DEFAULT FALSE")
-            if 'access_count' not in column_names:
-                await db.execute("ALTER TABLE document_content ADD COLUMN access_count INTEGER DEFAULT 1")
-            if 'last_accessed' not in column_names:
-                await db.execute("ALTER TABLE document_content ADD COLUMN last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+            if version < 3 and "document_content" in tables:
+                # Version 3 moves document bodies out to files; inline blobs are
+                # dropped and refetched on demand rather than exported here
+                await db.execute("DROP TABLE document_content")
             
-            # Check analysis_results table
-            cursor = await db.execute("PRAGMA table_info(analysis_results)")
-            columns = await cursor.fetchall()
-            column_names = [col[1] for col in columns]
+            if version < 4 and "cache_performance" in tables:
+                # Version 4 replaces the floating point running average with an
+                # integer response time sum
+                await db.execute("ALTER TABLE cache_performance RENAME TO cache_performance_old")
+                await db.execute(CACHE_PERFORMANCE_SCHEMA)
+                await db.execute(
+                    "INSERT INTO cache_performance (operation, cache_hits, cache_misses, total_requests, total_response_time_us, last_updated) "
+                    "SELECT operation, cache_hits, cache_misses, total_requests, CAST(avg_response_time_ms * total_requests * 1000 AS INTEGER), last_updated "
+                    "FROM cache_performance_old"
+                )
+                await db.execute("DROP TABLE cache_performance_old")
             
-            # Add missing columns to analysis_results
-            if 'is_compressed' not in column_names:
-                await db.execute("ALTER TABLE analysis_results ADD COLUMN is_compressed BOOLEAN DEFAULT FALSE")
-            if 'access_count' not in column_names:
-                await db.execute("ALTER TABLE analysis_results ADD COLUMN access_count INTEGER DEFAULT 1")
-            if 'last_accessed' not in column_names:
-                await db.execute("ALTER TABLE analysis_results ADD COLUMN last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+            if version < 5 and "filing_metadata" in tables:
+                # Version 5 compresses large filing metadata; existing rows stay raw
+                cursor = await db.execute("PRAGMA table_info(filing_metadata)")
+                if 'is_compressed' not in [col[1] for col in await cursor.fetchall()]:
+                    await db.execute("ALTER TABLE filing_metadata ADD COLUMN is_compressed INTEGER DEFAULT 0")
             
+            await db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
             await db.commit()
             
         except Exception:
             # If migration fails, continue - the tables will be created fresh
             pass
     
-    def _is_expired(self, cached_at: str) -> bool:
-        """Check if cached data is expired."""
-        try:
-            cached_time = datetime.fromisoformat(cached_at.replace('Z', '+00:00'))
-            expiry_time = cached_time + timedelta(days=self.expiry_days)
-            return datetime.now() > expiry_time
-        except:
-            return True  # If we can't parse the date, consider it expired
+    def _expiry_cutoff(self) -> int:
+        """Unix time before which cached entries are considered expired."""
+        return int(time.time()) - self.expiry_days * 86400
     
     def _generate_hash(self, data: str) -> str:
         """Generate hash for data to detect changes."""
-        return hashlib.md5(data.encode()).hexdigest()
-    
-    def _compress_data(self, data: str) -> bytes:
-        """Compress data if compression is enabled."""
-        if self.compression_enabled:
-            return gzip.compress(data.encode('utf-8'))
-        return data.encode('utf-8')
-    
-    def _decompress_data(self, data: bytes, is_compressed: bool) -> str:
-        """Decompress data if it was compressed."""
-        if is_compressed and self.compression_enabled:
-            return gzip.decompress(data).decode('utf-8')
-        return data.decode('utf-8')
-    
-    async def _update_performance_stats(self, operation: str, is_hit: bool, response_time_ms: float):
-        """Update cache performance statistics."""
+        # Hashes are only used as change-detection keys, so a fast
+        # non-cryptographic hash is sufficient
+        return xxhash.xxh3_128_hexdigest(data.encode())
+    
+    def _load_compression_dictionary(self):
+        """Load the trained zstd dictionary if one exists."""
+        self._zdict = None
+        try:
+            dict_path = Path(self.dict_path)
+            if dict_path.exists():
+                self._zdict = zstd.ZstdCompressionDict(dict_path.read_bytes())
+        except Exception:
+            self._zdict = None  # Unreadable dictionary, compress without it
+        
+        # Contexts are built lazily per thread; a new generation makes every
+        # thread rebuild them against the current dictionary
+        self._codec_generation += 1
+    
+    def _codec_contexts(self) -> threading.local:
+        """Return zstd contexts owned by the calling thread.
+        
+        A zstd context must not be used by two threads at once, and large
+        payloads are (de)compressed in worker threads.
+        """
+        contexts = self._codec_local
+        if getattr(contexts, 'generation', None) != self._codec_generation:
+            # Compressors are created per level on first use
+            contexts.compressors = {}
+            if self._zdict is not None:
+                contexts.dict_decompressor = zstd.ZstdDecompressor(dict_data=self._zdict)
+            else:
+                contexts.dict_decompressor = None
+            contexts.decompressor = zstd.ZstdDecompressor()
+            contexts.generation = self._codec_generation
+        return contexts
+    
+    def _compressor(self, level: int) -> zstd.ZstdCompressor:
+        """Return the calling thread's zstd compressor for a level."""
+        compressors = self._codec_contexts().compressors
+        compressor = compressors.get(level)
+        if compressor is None:
+            if self._zdict is not None:
+                compressor = zstd.ZstdCompressor(level=level, dict_data=self._zdict)
+            else:
+                compressor = zstd.ZstdCompressor(level=level)
+            compressors[level] = compressor
+        return compressor
+    
+    def _compress_data(self, data: bytes, kind: str) -> Tuple[bytes, int]:
+        """Compress data for a payload kind, returning payload and codec tag.
+        
+        ``kind`` is one of the COMPRESSION_LEVELS keys. Small payloads are
+        returned raw.
+        """
+        if self.compression_enabled and len(data) >= COMPRESSION_MIN_BYTES:
+            return self._compressor(COMPRESSION_LEVELS[kind]).compress(data), CODEC_ZSTD
+        return data, CODEC_RAW
+    
+    def _decompress_data(self, data: bytes, codec: int) -> bytes:
+        """Decompress data according to the codec tag it was stored with."""
+        if codec == CODEC_ZSTD:
+            contexts = self._codec_contexts()
+            # The frame header records which dictionary (if any) was used
+            dict_id = zstd.get_frame_parameters(data).dict_id
+            if dict_id == 0:
+                return contexts.decompressor.decompress(data)
+            if self._zdict is not None and dict_id == self._zdict.dict_id():
+                return contexts.dict_decompressor.decompress(data)
+            raise ValueError(f"Data was compressed with unknown zstd dictionary {dict_id}")
+        if codec == CODEC_GZIP:
+            return gzip.decompress(data)
+        # Uncompressed rows may have been stored as TEXT
+        return data.encode('utf-8') if isinstance(data, str) else data
+    
+    def _document_relpath(self, cik: str, accession_number: str, primary_document: str) -> str:
+        """Build the docs_dir-relative file path for a cached document."""
+        parts = [_UNSAFE_PATH_CHARS.sub('_', part) or '_' for part in (cik, accession_number, primary_document)]
+        return f"{parts[0]}/{parts[1]}/{parts[2]}.zst"
+    
+    def _write_document_file(self, relpath: str, content: str) -> Tuple[int, int]:
+        """Compress content into its document file, returning stored size and codec tag."""
+        data, codec = self._compress_data(content.encode('utf-8'), "content")
+        path = self.docs_dir / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial file
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        return len(data), codec
+    
+    def _read_document_file(self, relpath: str, codec: int) -> str:
+        """Read and decompress a document file."""
+        return self._decompress_data((self.docs_dir / relpath).read_bytes(), codec).decode('utf-8')
+    
+    def _remove_document_files(self, relpaths: List[str]):
+        """Delete document files, ignoring ones that are already gone."""
+        for relpath in relpaths:
+            try:
+                (self.docs_dir / relpath).unlink()
+            except FileNotFoundError:
+                pass
+    
+    async def _compress_async(self, data: bytes, kind: str) -> Tuple[bytes, int]:
+        """Compress data, moving large payloads off the event loop."""
+        if len(data) >= OFFLOAD_THRESHOLD:
+            return await asyncio.to_thread(self._compress_data, data, kind)
+        return self._compress_data(data, kind)
+    
+    async def _decompress_async(self, data: bytes, codec: int) -> bytes:
+        """Decompress data, moving large payloads off the event loop."""
+        if len(data) >= OFFLOAD_THRESHOLD:
+            return await asyncio.to_thread(self._decompress_data, data, codec)
+        return self._decompress_data(data, codec)
+    
+    def _memory_get(self, cache: OrderedDict, key) -> Optional[Any]:
+        """Look up an unexpired entry in an in-process LRU layer."""
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del cache[key]
+            return None
+        cache.move_to_end(key)
+        return value
+    
+    def _memory_put(self, cache: OrderedDict, key, value, cached_at: int, max_entries: int):
+        """Store an entry in an in-process LRU layer, evicting the oldest."""
+        cache[key] = (value, cached_at + self.expiry_days * 24 * 60 * 60)
+        cache.move_to_end(key)
+        while len(cache) > max_entries:
+            cache.popitem(last=False)
+    
+    def _record_memory_hit(self, operation: str):
+        """Count a lookup answered by an in-process LRU layer."""
+        self._memory_hits[operation] = self._memory_hits.get(operation, 0) + 1
+        self.cache_hits += 1
+    
+    def _update_performance_stats(self, operation: str, is_hit: bool, response_time_us: int):
+        """Record a cache lookup in the in-memory performance buffer.
+        
+        The buffer is written to the database by flush_performance_stats(),
+        so cache reads never issue a write of their own.
+        """
         if not self.cache_enabled:
             return
-            
-        async with aiosqlite.connect(self.db_path) as db:
-            # Get current stats
-            cursor = await db.execute(
-                "SELECT cache_hits, cache_misses, total_requests, avg_response_time_ms FROM cache_performance WHERE operation = ?",
-                (operation,)
+        
+        counters = self._perf_buffer.setdefault(operation, [0, 0, 0])
+        if is_hit:
+            counters[0] += 1
+        else:
+            counters[1] += 1
+        counters[2] += response_time_us
+    
+    async def flush_performance_stats(self):
+        """Write buffered performance counters to the database."""
+        if not self.cache_enabled or not self._perf_buffer or self._db is None:
+            return
+        
+        buffer, self._perf_buffer = self._perf_buffer, {}
+        rows = [
+            (operation, hits, misses, hits + misses, total_us)
+            for operation, (hits, misses, total_us) in buffer.items()
+        ]
+        
+        # Fold the buffered counts into the running totals in a single upsert
+        async with self.transaction():
+            await self._db.executemany(
+                """
+                INSERT INTO cache_performance (operation, cache_hits, cache_misses, total_requests, total_response_time_us)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(operation) DO UPDATE SET
+                    cache_hits = cache_hits + excluded.cache_hits,
+                    cache_misses = cache_misses + excluded.cache_misses,
+                    total_requests = total_requests + excluded.total_requests,
+                    total_response_time_us = total_response_time_us + excluded.total_response_time_us,
+                    last_updated = CURRENT_TIMESTAMP
+                """,
+                rows
             )
-            row = await cursor.fetchone()
-            
-            if row:
-                hits, misses, total, avg_time = row
-                if is_hit:
-                    hits += 1
-                else:
-                    misses += 1
-                total += 1
-                # Update running average
-                avg_time = ((avg_time * (total - 1)) + response_time_ms) / total
-                
-                await db.execute(
-                    "UPDATE cache_performance SET cache_hits = ?, cache_misses = ?, total_requests = ?, avg_response_time_ms = ?, last_updated = CURRENT_TIMESTAMP WHERE operation = ?",
-                    (hits, misses, total, avg_time, operation)
+    
+    def _record_access(self, buffer: Dict[Tuple[str, str, str], List[int]], key: Tuple[str, str, str]):
+        """Record a cache hit in an in-memory access buffer."""
+        entry = buffer.setdefault(key, [0, 0])
+        entry[0] += 1
+        entry[1] = int(time.time())
+    
+    async def flush_access_stats(self):
+        """Write buffered access counts and last-access times to the database."""
+        if not self.cache_enabled or self._db is None:
+            return
+        if not self._document_access_buffer and not self._analysis_access_buffer:
+            return
+        
+        documents, self._document_access_buffer = self._document_access_buffer, {}
+        analyses, self._analysis_access_buffer = self._analysis_access_buffer, {}
+        
+        async with self.transaction():
+            if documents:
+                await self._db.executemany(
+                    "UPDATE document_content SET access_count = access_count + ?, last_accessed = MAX(last_accessed, ?) WHERE cik = ? AND accession_number = ? AND primary_document = ?",
+                    [(count, accessed, *key) for key, (count, accessed) in documents.items()]
                 )
-            else:
-                # First entry for this operation
-                hits = 1 if is_hit else 0
-                misses = 0 if is_hit else 1
-                await db.execute(
-                    "INSERT INTO cache_performance (operation, cache_hits, cache_misses, total_requests, avg_response_time_ms) VALUES (?, ?, ?, 1, ?)",
-                    (operation, hits, misses, response_time_ms)
+            if analyses:
+                await self._db.executemany(
+                    "UPDATE analysis_results SET access_count = access_count + ?, last_accessed = MAX(last_accessed, ?) WHERE ticker = ? AND report_type = ? AND content_hash = ?",
+                    [(count, accessed, *key) for key, (count, accessed) in analyses.items()]
                 )
-            
-            await db.commit()
+    
+    async def flush_stats(self):
+        """Write all buffered performance and access statistics."""
+        await self.flush_performance_stats()
+        await self.flush_access_stats()
+    
+    async def _flush_periodically(self):
+        """Flush buffered statistics in the background."""
+        while True:
+            await asyncio.sleep(STATS_FLUSH_INTERVAL_SECONDS)
+            try:
+                await self.flush_stats()
+            except Exception:
+                pass  # Ignore errors in statistics tracking
     
     async def get_company_cik(self, ticker: str) -> Optional[str]:
         """Get cached CIK for a company ticker."""
         if not self.cache_enabled:
             return None
         
-        start_time = time.time()
+        ticker = ticker.upper()
+        cik = self._memory_get(self._cik_mem, ticker)
+        if cik is not None:
+            self._record_memory_hit("company_cik")
+            return cik
         
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "SELECT cik, cached_at FROM company_ciks WHERE ticker = ?",
-                (ticker.upper(),)
-            )
-            row = await cursor.fetchone()
-            
-            response_time = (time.time() - start_time) * 1000
-            
-            if row and not self._is_expired(row[1]):
-                await self._update_performance_stats("company_cik", True, response_time)
-                self.cache_hits += 1
-                return row[0]
-            
-            await self._update_performance_stats("company_cik", False, response_time)
-            self.cache_misses += 1
+        start_time = time.perf_counter_ns()
+        
+        db = await self._get_db()
+        cursor = await db.execute(
+            "SELECT cik, cached_at FROM company_ciks WHERE ticker = ? AND cached_at > ?",
+            (ticker, self._expiry_cutoff())
+        )
+        row = await cursor.fetchone()
+        
+        response_time = (time.perf_counter_ns() - start_time) // 1000
+        
+        if row:
+            self._update_performance_stats("company_cik", True, response_time)
+            self.cache_hits += 1
+            self._memory_put(self._cik_mem, ticker, row[0], row[1], CIK_MEMORY_CACHE_SIZE)
+            return row[0]
+        
+        self._update_performance_stats("company_cik", False, response_time)
+        self.cache_misses += 1
         
         return None
     
@@ -242,78 +684,163 @@ class CacheManager:
         if not self.cache_enabled:
             return
             
-        async with aiosqlite.connect(self.db_path) as db:
+        now = int(time.time())
+        db = await self._get_db()
+        async with self.transaction():
             await db.execute(
-                "INSERT OR REPLACE INTO company_ciks (ticker, cik) VALUES (?, ?)",
-                (ticker.upper(), cik)
+                "INSERT OR REPLACE INTO company_ciks (ticker, cik, cached_at) VALUES (?, ?, ?)",
+                (ticker.upper(), cik, now)
             )
-            await db.commit()
+        self._memory_put(self._cik_mem, ticker.upper(), cik, now, CIK_MEMORY_CACHE_SIZE)
     
     async def get_filing_metadata(self, ticker: str, report_type: str) -> Optional[List[Dict]]:
         """Get cached filing metadata for a company and report type."""
         if not self.cache_enabled:
             return None
             
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "SELECT metadata_json, cached_at FROM filing_metadata WHERE ticker = ? AND report_type = ? ORDER BY cached_at DESC LIMIT 1",
-                (ticker.upper(), report_type)
-            )
-            row = await cursor.fetchone()
-            
-            if row and not self._is_expired(row[1]):
-                try:
-                    return json.loads(row[0])
-                except json.JSONDecodeError:
-                    pass
+        key = (ticker.upper(), report_type)
+        metadata = self._memory_get(self._metadata_mem, key)
+        if metadata is not None:
+            self._record_memory_hit("filing_metadata")
+            # Copy so callers can't mutate the memoized entry
+            return [dict(report) for report in metadata]
+        
+        db = await self._get_db()
+        cursor = await db.execute(
+            "SELECT metadata_json, is_compressed, cached_at FROM filing_metadata WHERE ticker = ? AND report_type = ? AND cached_at > ? ORDER BY cached_at DESC LIMIT 1",
+            (key[0], report_type, self._expiry_cutoff())
+        )
+        row = await cursor.fetchone()
+        
+        if row:
+            try:
+                metadata = orjson.loads(await self._decompress_async(row[0], row[1]))
+            except Exception:
+                return None
+            self._memory_put(self._metadata_mem, key, metadata, row[2], METADATA_MEMORY_CACHE_SIZE)
+            return [dict(report) for report in metadata]
         
         return None
     
+    async def _metadata_column(self, metadata_bytes: bytes) -> Tuple[Any, int]:
+        """Encode serialized metadata for the metadata_json column.
+        
+        Uncompressed metadata is stored as TEXT, as it always has been.
+        """
+        stored, codec = await self._compress_async(metadata_bytes, "metadata")
+        if codec == CODEC_RAW:
+            return stored.decode('utf-8'), codec
+        return stored, codec
+    
     async def cache_filing_metadata(self, ticker: str, report_type: str, metadata: List[Dict]):
         """Cache filing metadata for a company and report type."""
         if not self.cache_enabled:
             return
             
-        metadata_json = json.dumps(metadata, default=str)
-        data_hash = self._generate_hash(metadata_json)
+        metadata_bytes = orjson.dumps(metadata, default=str, option=ORJSON_OPTIONS)
+        data_hash = self._generate_hash(metadata_bytes.decode('utf-8'))
+        stored, codec = await self._metadata_column(metadata_bytes)
         
-        async with aiosqlite.connect(self.db_path) as db:
+        now = int(time.time())
+        db = await self._get_db()
+        async with self.transaction():
             await db.execute(
-                "INSERT OR REPLACE INTO filing_metadata (ticker, report_type, data_hash, metadata_json) VALUES (?, ?, ?, ?)",
-                (ticker.upper(), report_type, data_hash, metadata_json)
+                "INSERT OR REPLACE INTO filing_metadata (ticker, report_type, data_hash, metadata_json, is_compressed, cached_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (ticker.upper(), report_type, data_hash, stored, codec, now)
             )
-            await db.commit()
+        # Memoize the serialized form so cache hits match what SQLite returns
+        self._memory_put(self._metadata_mem, (ticker.upper(), report_type), orjson.loads(metadata_bytes),
+                         now, METADATA_MEMORY_CACHE_SIZE)
+    
+    async def cache_reports_bulk(self, entries: List[Tuple[str, str, List[Dict]]]):
+        """Cache filing metadata and document content for many tickers at once.
+        
+        Each entry is ``(ticker, report_type, reports)``. All rows are written
+        with ``executemany`` in a single transaction, so warming N tickers costs
+        one commit instead of one per row.
+        """
+        if not self.cache_enabled or not entries:
+            return
+        
+        # Check cache size limit
+        await self._enforce_cache_size_limit()
+        
+        now = int(time.time())
+        metadata_rows = []
+        documents = []
+        memoized = []
+        
+        for ticker, report_type, reports in entries:
+            metadata_bytes = orjson.dumps(reports, default=str, option=ORJSON_OPTIONS)
+            stored, codec = await self._metadata_column(metadata_bytes)
+            metadata_rows.append(
+                (ticker.upper(), report_type, self._generate_hash(metadata_bytes.decode('utf-8')), stored, codec, now)
+            )
+            memoized.append(((ticker.upper(), report_type), metadata_bytes))
+            
+            for report in reports:
+                content = report.get('content')
+                # Skip error and placeholder text left by a failed download
+                if not content or not report.get('accession_number') or not report.get('content_available', True):
+                    continue
+                key = (report.get('cik', ''), report['accession_number'], report.get('primary_document', ''))
+                documents.append((key, self._document_relpath(*key), content))
+        
+        # Document files are written concurrently from worker threads
+        written = await asyncio.gather(*(
+            asyncio.to_thread(self._write_document_file, relpath, content)
+            for _, relpath, content in documents
+        ))
+        document_rows = [
+            (*key, relpath, len(content), stored_size, codec, now, now)
+            for (key, relpath, content), (stored_size, codec) in zip(documents, written)
+        ]
+        
+        db = await self._get_db()
+        async with self.transaction():
+            await db.executemany(
+                "INSERT OR REPLACE INTO filing_metadata (ticker, report_type, data_hash, metadata_json, is_compressed, cached_at) VALUES (?, ?, ?, ?, ?, ?)",
+                metadata_rows
+            )
+            if document_rows:
+                await db.executemany(
+                    "INSERT OR REPLACE INTO document_content (cik, accession_number, primary_document, content_path, content_length, stored_size, is_compressed, cached_at, last_accessed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    document_rows
+                )
+        
+        for key, metadata_bytes in memoized:
+            self._memory_put(self._metadata_mem, key, orjson.loads(metadata_bytes), now, METADATA_MEMORY_CACHE_SIZE)
     
     async def get_document_content(self, cik: str, accession_number: str, primary_document: str) -> Optional[str]:
         """Get cached document content."""
         if not self.cache_enabled:
             return None
         
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "SELECT content, is_compressed, cached_at FROM document_content WHERE cik = ? AND accession_number = ? AND primary_document = ?",
-                (cik, accession_number, primary_document)
-            )
-            row = await cursor.fetchone()
-            
-            response_time = (time.time() - start_time) * 1000
+        db = await self._get_db()
+        cursor = await db.execute(
+            "SELECT content_path, is_compressed FROM document_content WHERE cik = ? AND accession_number = ? AND primary_document = ? AND cached_at > ?",
+            (cik, accession_number, primary_document, self._expiry_cutoff())
+        )
+        row = await cursor.fetchone()
+        
+        response_time = (time.perf_counter_ns() - start_time) // 1000
+        
+        if row:
+            try:
+                content = await asyncio.to_thread(self._read_document_file, row[0], row[1])
+            except Exception:
+                content = None  # Missing or undecodable file, treat as a miss
             
-            if row and not self._is_expired(row[2]):
-                # Update access statistics
-                await db.execute(
-                    "UPDATE document_content SET access_count = access_count + 1, last_accessed = CURRENT_TIMESTAMP WHERE cik = ? AND accession_number = ? AND primary_document = ?",
-                    (cik, accession_number, primary_document)
-                )
-                await db.commit()
-                
-                await self._update_performance_stats("document_content", True, response_time)
+            if content is not None:
+                self._record_access(self._document_access_buffer, (cik, accession_number, primary_document))
+                self._update_performance_stats("document_content", True, response_time)
                 self.cache_hits += 1
-                return self._decompress_data(row[0], row[1])
-            
-            await self._update_performance_stats("document_content", False, response_time)
-            self.cache_misses += 1
+                return content
+        
+        self._update_performance_stats("document_content", False, response_time)
+        self.cache_misses += 1
         
         return None
     
@@ -325,50 +852,46 @@ class CacheManager:
         # Check cache size limit
         await self._enforce_cache_size_limit()
         
-        compressed_content = self._compress_data(content)
+        relpath = self._document_relpath(cik, accession_number, primary_document)
+        stored_size, codec = await asyncio.to_thread(self._write_document_file, relpath, content)
+        now = int(time.time())
         
-        async with aiosqlite.connect(self.db_path) as db:
+        db = await self._get_db()
+        async with self.transaction():
             await db.execute(
-                "INSERT OR REPLACE INTO document_content (cik, accession_number, primary_document, content, content_length, is_compressed) VALUES (?, ?, ?, ?, ?, ?)",
-                (cik, accession_number, primary_document, compressed_content, len(content), self.compression_enabled)
+                "INSERT OR REPLACE INTO document_content (cik, accession_number, primary_document, content_path, content_length, stored_size, is_compressed, cached_at, last_accessed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (cik, accession_number, primary_document, relpath, len(content), stored_size, codec, now, now)
             )
-            await db.commit()
     
-    async def get_analysis_results(self, ticker: str, report_type: str, content_hash: str) -> Optional[Dict[str, Any]]:
-        """Get cached analysis results."""
+    async def get_analysis_results(self, ticker: str, report_type: str, content_hash: str,
+                                   operation: str = "analysis_results") -> Optional[Dict[str, Any]]:
+        """Get cached analysis results, recording the lookup under ``operation``."""
         if not self.cache_enabled:
             return None
         
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "SELECT analysis_json, is_compressed, cached_at FROM analysis_results WHERE ticker = ? AND report_type = ? AND content_hash = ?",
-                (ticker.upper(), report_type, content_hash)
-            )
-            row = await cursor.fetchone()
-            
-            response_time = (time.time() - start_time) * 1000
-            
-            if row and not self._is_expired(row[2]):
-                # Update access statistics
-                await db.execute(
-                    "UPDATE analysis_results SET access_count = access_count + 1, last_accessed = CURRENT_TIMESTAMP WHERE ticker = ? AND report_type = ? AND content_hash = ?",
-                    (ticker.upper(), report_type, content_hash)
-                )
-                await db.commit()
-                
-                await self._update_performance_stats("analysis_results", True, response_time)
-                self.cache_hits += 1
-                
-                try:
-                    decompressed = self._decompress_data(row[0], row[1])
-                    return json.loads(decompressed)
-                except (json.JSONDecodeError, Exception):
-                    pass
+        db = await self._get_db()
+        cursor = await db.execute(
+            "SELECT analysis_json, is_compressed FROM analysis_results WHERE ticker = ? AND report_type = ? AND content_hash = ? AND cached_at > ?",
+            (ticker.upper(), report_type, content_hash, self._expiry_cutoff())
+        )
+        row = await cursor.fetchone()
+        
+        response_time = (time.perf_counter_ns() - start_time) // 1000
+        
+        if row:
+            self._record_access(self._analysis_access_buffer, (ticker.upper(), report_type, content_hash))
+            self._update_performance_stats(operation, True, response_time)
+            self.cache_hits += 1
             
-            await self._update_performance_stats("analysis_results", False, response_time)
-            self.cache_misses += 1
+            try:
+                return orjson.loads(await self._decompress_async(row[0], row[1]))
+            except Exception:
+                pass
+        
+        self._update_performance_stats(operation, False, response_time)
+        self.cache_misses += 1
         
         return None
     
@@ -380,141 +903,286 @@ class CacheManager:
         # Check cache size limit
         await self._enforce_cache_size_limit()
         
-        analysis_json = json.dumps(analysis, default=str)
-        compressed_analysis = self._compress_data(analysis_json)
+        analysis_json = orjson.dumps(analysis, default=str, option=ORJSON_OPTIONS)
+        compressed_analysis, codec = await self._compress_async(analysis_json, "analysis")
+        now = int(time.time())
         
-        async with aiosqlite.connect(self.db_path) as db:
+        db = await self._get_db()
+        async with self.transaction():
             await db.execute(
-                "INSERT OR REPLACE INTO analysis_results (ticker, report_type, content_hash, analysis_json, is_compressed) VALUES (?, ?, ?, ?, ?)",
-                (ticker.upper(), report_type, content_hash, compressed_analysis, self.compression_enabled)
+                "INSERT OR REPLACE INTO analysis_results (ticker, report_type, content_hash, analysis_json, is_compressed, cached_at, last_accessed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (ticker.upper(), report_type, content_hash, compressed_analysis, codec, now, now)
             )
-            await db.commit()
+    
+    async def get_sub_analysis(self, ticker: str, report_type: str, kind: str, content_hash: str) -> Optional[str]:
+        """Get a cached financial, operational, strategic or synthesis response.
+        
+        Sub-analyses live in analysis_results under a ``report_type:kind`` key,
+        so they share its expiry, compression and LRU eviction; their lookups
+        are reported as the ``sub_analysis`` operation.
+        """
+        cached = await self.get_analysis_results(ticker, f"{report_type}:{kind}", content_hash, "sub_analysis")
+        return cached.get('analysis') if cached else None
+    
+    async def cache_sub_analysis(self, ticker: str, report_type: str, kind: str, content_hash: str, analysis: str):
+        """Cache a single sub-analysis response."""
+        await self.cache_analysis_results(ticker, f"{report_type}:{kind}", content_hash, {'analysis': analysis})
     
     async def cleanup_expired_cache(self):
         """Remove expired cache entries."""
         if not self.cache_enabled:
             return
             
-        expiry_date = datetime.now() - timedelta(days=self.expiry_days)
-        expiry_str = expiry_date.isoformat()
-        
-        async with aiosqlite.connect(self.db_path) as db:
-            # Clean up expired entries
-            await db.execute("DELETE FROM company_ciks WHERE cached_at < ?", (expiry_str,))
-            await db.execute("DELETE FROM filing_metadata WHERE cached_at < ?", (expiry_str,))
-            await db.execute("DELETE FROM document_content WHERE cached_at < ?", (expiry_str,))
-            await db.execute("DELETE FROM analysis_results WHERE cached_at < ?", (expiry_str,))
-            
-            # Vacuum to reclaim space
-            await db.execute("VACUUM")
-            await db.commit()
+        cutoff = self._expiry_cutoff()
+        
+        db = await self._get_db()
+        # Clean up expired entries in a single write transaction
+        async with self.transaction():
+            await db.execute("DELETE FROM company_ciks WHERE cached_at <= ?", (cutoff,))
+            await db.execute("DELETE FROM filing_metadata WHERE cached_at <= ?", (cutoff,))
+            cursor = await db.execute("SELECT content_path FROM document_content WHERE cached_at <= ?", (cutoff,))
+            expired_paths = [row[0] for row in await cursor.fetchall()]
+            await db.execute("DELETE FROM document_content WHERE cached_at <= ?", (cutoff,))
+            await db.execute("DELETE FROM analysis_results WHERE cached_at <= ?", (cutoff,))
+        
+        await asyncio.to_thread(self._remove_document_files, expired_paths)
+        
+        # Return a bounded number of free pages instead of rewriting the whole
+        # file with VACUUM. executescript steps the pragma to completion; a
+        # plain execute only frees a single page. It also commits whatever is
+        # pending first, so it runs under the write lock between transactions.
+        async with self._write_lock:
+            await db.executescript(f"PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES});")
+    
+    async def build_dictionary(self, max_samples: int = 100, dict_size: int = 16384) -> Dict[str, Any]:
+        """Train a zstd dictionary from cached metadata and analysis results.
+        
+        The dictionary is written to ``cache_dict_path`` and used for all new
+        compressed rows. Existing rows keep decoding because each zstd frame
+        records the id of the dictionary it was written with.
+        """
+        if not self.cache_enabled:
+            return {"cache_enabled": False}
+        
+        samples = []
+        db = await self._get_db()
+        cursor = await db.execute(
+            "SELECT metadata_json, is_compressed FROM filing_metadata ORDER BY cached_at DESC LIMIT ?",
+            (max_samples,)
+        )
+        for metadata_json, codec in await cursor.fetchall():
+            try:
+                samples.append(self._decompress_data(metadata_json, codec))
+            except Exception:
+                continue
+        
+        cursor = await db.execute(
+            "SELECT analysis_json, is_compressed FROM analysis_results ORDER BY cached_at DESC LIMIT ?",
+            (max_samples,)
+        )
+        for analysis_json, codec in await cursor.fetchall():
+            try:
+                samples.append(self._decompress_data(analysis_json, codec))
+            except Exception:
+                continue
+        
+        if not samples:
+            raise ValueError("No cached metadata or analysis results to train a dictionary from")
+        
+        zdict = zstd.train_dictionary(dict_size, samples)
+        Path(self.dict_path).write_bytes(zdict.as_bytes())
+        self._load_compression_dictionary()
+        
+        return {
+            "dict_path": self.dict_path,
+            "dict_id": zdict.dict_id(),
+            "dict_size": len(zdict.as_bytes()),
+            "samples": len(samples)
+        }
     
     async def get_cache_stats(self) -> Dict[str, Any]:
         """Get cache statistics."""
         if not self.cache_enabled:
             return {"cache_enabled": False}
             
-        async with aiosqlite.connect(self.db_path) as db:
-            stats = {"cache_enabled": True}
-            
-            # Count entries in each table
-            for table in ["company_ciks", "filing_metadata", "document_content", "analysis_results"]:
-                cursor = await db.execute(f"SELECT COUNT(*) FROM {table}")
-                count = await cursor.fetchone()
-                stats[f"{table}_count"] = count[0] if count else 0
-            
-            # Get database file size
-            try:
-                db_path = Path(self.db_path)
-                if db_path.exists():
-                    stats["db_size_mb"] = round(db_path.stat().st_size / (1024 * 1024), 2)
-                else:
-                    stats["db_size_mb"] = 0
-            except:
-                stats["db_size_mb"] = "unknown"
-            
-            # Get oldest and newest cache entries
-            cursor = await db.execute("SELECT MIN(cached_at), MAX(cached_at) FROM company_ciks")
-            row = await cursor.fetchone()
-            if row and row[0]:
-                stats["oldest_entry"] = row[0]
-                stats["newest_entry"] = row[1]
-            
-            return stats
+        db = await self._get_db()
+        stats = {"cache_enabled": True}
+        
+        # Count entries in each table
+        cursor = await db.execute(TABLE_COUNTS_QUERY)
+        counts = await cursor.fetchone()
+        for table, count in zip(TABLE_COUNT_NAMES, counts):
+            stats[f"{table}_count"] = count
+        
+        # Get database file size
+        try:
+            db_path = Path(self.db_path)
+            if db_path.exists():
+                stats["db_size_mb"] = round(db_path.stat().st_size / (1024 * 1024), 2)
+            else:
+                stats["db_size_mb"] = 0
+        except:
+            stats["db_size_mb"] = "unknown"
+        
+        cursor = await db.execute("SELECT COALESCE(SUM(stored_size), 0) FROM document_content")
+        stats["docs_size_mb"] = round((await cursor.fetchone())[0] / (1024 * 1024), 2)
+        
+        # Get oldest and newest cache entries
+        cursor = await db.execute("SELECT MIN(cached_at), MAX(cached_at) FROM company_ciks")
+        row = await cursor.fetchone()
+        if row and row[0]:
+            stats["oldest_entry"] = datetime.fromtimestamp(row[0]).strftime('%Y-%m-%d %H:%M:%S')
+            stats["newest_entry"] = datetime.fromtimestamp(row[1]).strftime('%Y-%m-%d %H:%M:%S')
+        
+        return stats
     
     async def _enforce_cache_size_limit(self):
         """Enforce cache size limits by removing least recently used items."""
         if not self.cache_enabled:
             return
         
+        # Checking the size on every write is wasted work; sample periodically
+        check_now = self._write_count % SIZE_CHECK_INTERVAL == 0
+        self._write_count += 1
+        if not check_now:
+            return
+        
         try:
-            db_path = Path(self.db_path)
-            if db_path.exists():
-                current_size_mb = db_path.stat().st_size / (1024 * 1024)
+            db = await self._get_db()
+            
+            # Live pages come from the database header instead of a file stat,
+            # and exclude free pages that deletes leave behind until a vacuum
+            cursor = await db.execute("PRAGMA page_count")
+            page_count = (await cursor.fetchone())[0]
+            cursor = await db.execute("PRAGMA freelist_count")
+            free_pages = (await cursor.fetchone())[0]
+            
+            cursor = await db.execute("SELECT COALESCE(SUM(stored_size), 0) FROM document_content")
+            docs_bytes = (await cursor.fetchone())[0]
+            
+            max_bytes = self.max_cache_size_mb * 1024 * 1024
+            current_bytes = (page_count - free_pages) * self._page_size + docs_bytes
+            if current_bytes <= max_bytes:
+                return
+            
+            # Evict down to a low watermark so the next writes don't immediately
+            # trigger another eviction
+            bytes_over = current_bytes - max_bytes * EVICTION_TARGET_RATIO
+            
+            # Evict in one transaction so the scan and deletes see the same rows
+            async with self.transaction():
+                # Persist pending hits first so recently read rows aren't evicted
+                await self.flush_access_stats()
                 
-                if current_size_mb > self.max_cache_size_mb:
-                    async with aiosqlite.connect(self.db_path) as db:
-                        # Remove least recently accessed document content
-                        await db.execute(
-                            "DELETE FROM document_content WHERE rowid IN (SELECT rowid FROM document_content ORDER BY last_accessed ASC LIMIT 10)"
-                        )
-                        
-                        # Remove least recently accessed analysis results
+                # Document files carry exact sizes, so walk them in LRU order until
+                # the overage is covered
+                evicted_rowids = []
+                evicted_paths = []
+                cursor = await db.execute(
+                    "SELECT rowid, content_path, stored_size FROM document_content ORDER BY last_accessed ASC"
+                )
+                async for rowid, content_path, stored_size in cursor:
+                    if bytes_over <= 0:
+                        break
+                    evicted_rowids.append((rowid,))
+                    evicted_paths.append(content_path)
+                    bytes_over -= stored_size or 0
+                await cursor.close()
+                
+                if evicted_rowids:
+                    await db.executemany("DELETE FROM document_content WHERE rowid = ?", evicted_rowids)
+                
+                if bytes_over > 0:
+                    cursor = await db.execute("SELECT COUNT(*), AVG(LENGTH(analysis_json)) FROM analysis_results")
+                    count, avg_size = await cursor.fetchone()
+                    if count:
+                        # Estimate how many least recently used rows cover the overage
+                        limit = min(count, math.ceil(bytes_over / max(avg_size, 1)))
                         await db.execute(
-                            "DELETE FROM analysis_results WHERE rowid IN (SELECT rowid FROM analysis_results ORDER BY last_accessed ASC LIMIT 5)"
+                            "DELETE FROM analysis_results WHERE rowid IN (SELECT rowid FROM analysis_results ORDER BY last_accessed ASC LIMIT ?)",
+                            (limit,)
                         )
-                        
-                        await db.commit()
+            
+            # Files are removed only once the rows pointing at them are gone
+            await asyncio.to_thread(self._remove_document_files, evicted_paths)
         except Exception:
             pass  # Ignore errors in cache management
     
+    @staticmethod
+    def _hit_rate(hits: int, total: int) -> float:
+        """Hit percentage rounded to two decimals, computed in integer basis points."""
+        if total <= 0:
+            return 0
+        return (hits * 10000 + total // 2) // total / 100
+    
     async def get_performance_stats(self) -> Dict[str, Any]:
         """Get detailed cache performance statistics."""
         if not self.cache_enabled:
             return {"cache_enabled": False}
         
-        async with aiosqlite.connect(self.db_path) as db:
-            stats = {"cache_enabled": True}
-            
-            # Get performance data
-            cursor = await db.execute("SELECT * FROM cache_performance")
-            perf_data = await cursor.fetchall()
-            
-            performance = {}
-            total_hits = 0
-            total_misses = 0
-            
-            for row in perf_data:
-                operation, hits, misses, total, avg_time, last_updated = row
-                performance[operation] = {
-                    "hits": hits,
-                    "misses": misses,
-                    "total_requests": total,
-                    "hit_rate": round((hits / total * 100) if total > 0 else 0, 2),
-                    "avg_response_time_ms": round(avg_time, 2),
-                    "last_updated": last_updated
-                }
-                total_hits += hits
-                total_misses += misses
-            
-            stats["performance"] = performance
-            stats["overall_hit_rate"] = round((total_hits / (total_hits + total_misses) * 100) if (total_hits + total_misses) > 0 else 0, 2)
-            stats["session_hits"] = self.cache_hits
-            stats["session_misses"] = self.cache_misses
-            
-            return stats
+        db = await self._get_db()
+        stats = {"cache_enabled": True}
+        
+        await self.flush_performance_stats()
+        
+        # Get performance data
+        cursor = await db.execute(
+            "SELECT operation, cache_hits, cache_misses, total_requests, total_response_time_us, last_updated FROM cache_performance"
+        )
+        perf_data = await cursor.fetchall()
+        
+        performance = {}
+        total_hits = 0
+        total_misses = 0
+        
+        for row in perf_data:
+            operation, hits, misses, total, total_us, last_updated = row
+            performance[operation] = {
+                "hits": hits,
+                "misses": misses,
+                "total_requests": total,
+                "hit_rate": self._hit_rate(hits, total),
+                "avg_response_time_ms": round(total_us / total / 1000, 2) if total > 0 else 0,
+                "last_updated": last_updated
+            }
+            total_hits += hits
+            total_misses += misses
+        
+        stats["performance"] = performance
+        stats["overall_hit_rate"] = self._hit_rate(total_hits, total_hits + total_misses)
+        stats["session_hits"] = self.cache_hits
+        stats["session_misses"] = self.cache_misses
+        # Served by the in-process LRU layers; not included in the SQLite figures above
+        stats["memory_hits"] = dict(self._memory_hits)
+        
+        return stats
     
     async def clear_cache(self, table: Optional[str] = None):
         """Clear cache data."""
         if not self.cache_enabled:
             return
+        if table is not None and table not in CLEAR_TABLE_STATEMENTS:
+            raise ValueError(f"Unknown cache table: {table}")
             
-        async with aiosqlite.connect(self.db_path) as db:
+        db = await self._get_db()
+        if table in (None, "company_ciks"):
+            self._cik_mem.clear()
+        if table in (None, "filing_metadata"):
+            self._metadata_mem.clear()
+        if table in (None, "document_content"):
+            self._document_access_buffer.clear()
+        if table in (None, "analysis_results"):
+            self._analysis_access_buffer.clear()
+        
+        async with self.transaction():
             if table:
-                await db.execute(f"DELETE FROM {table}")
+                await db.execute(CLEAR_TABLE_STATEMENTS[table])
             else:
                 # Clear all tables
-                for table_name in ["company_ciks", "filing_metadata", "document_content", "analysis_results", "cache_performance"]:
-                    await db.execute(f"DELETE FROM {table_name}")
-            
-            await db.commit()
\ No newline at end of file
+                for statement in CLEAR_TABLE_STATEMENTS.values():
+                    await db.execute(statement)
+                self._perf_buffer.clear()
+                self._memory_hits.clear()
+        
+        if table in (None, "document_content"):
+            await asyncio.to_thread(shutil.rmtree, self.docs_dir, True)
\ No newline at end of file
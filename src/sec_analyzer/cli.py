@@ -8,14 +8,14 @@ from rich.progress import Progress, SpinnerColumn, TextColumn
 import asyncio
 from typing import Optional
 
-from .config import Config
-from .sec_client import SECClient
-from .risk_analyzer import RiskAnalyzer
-from .report_generator import ReportGenerator
+from .config import Config, get_config
 from .cache_manager import CacheManager
 
-console = Console()
+# SECClient (edgartools, pandas), RiskAnalyzer (boto3) and ReportGenerator are
+# imported inside the commands that use them, so --help, config and the cache
+# commands start without loading them
 
+console = Console()
 
 @click.group()
 @click.version_option()
@@ -23,7 +23,18 @@ console = Console()
 def cli(ctx):
     """SEC Analyzer - Assess company risks from SEC reports using AI."""
     ctx.ensure_object(dict)
-    ctx.obj['config'] = Config()
+    ctx.obj['config'] = get_config()
+
+
+def _get_cache_manager(ctx) -> CacheManager:
+    """Return the invocation's shared cache manager, creating it on first use.
+    
+    SECClient and RiskAnalyzer are handed this instance so a command opens
+    the cache database once instead of once per component.
+    """
+    if 'cache_manager' not in ctx.obj:
+        ctx.obj['cache_manager'] = CacheManager(ctx.obj['config'])
+    return ctx.obj['cache_manager']
 
 
 @cli.command()
@@ -50,61 +61,75 @@ def analyze(ctx, ticker: str, report_type: str, output: Optional[str], verbose:
         title="Analysis Started"
     ))
     
-    asyncio.run(_run_analysis(config, ticker, report_type, output, verbose))
+    asyncio.run(_run_analysis(config, _get_cache_manager(ctx), ticker, report_type, output, verbose))
 
 
-async def _run_analysis(config: Config, ticker: str, report_type: str, 
+async def _run_analysis(config: Config, cache_manager: CacheManager, ticker: str, report_type: str, 
                        output: Optional[str], verbose: bool):
     """Run the complete analysis workflow."""
+    from .sec_client import SECClient
+    from .risk_analyzer import RiskAnalyzer
+    from .report_generator import ReportGenerator
     
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        console=console,
-    ) as progress:
-        
-        # Initialize components
-        task1 = progress.add_task("Initializing SEC client...", total=None)
-        sec_client = SECClient(config)
-        await sec_client.initialize()
-        
-        task2 = progress.add_task("Initializing AI risk analyzer...", total=None)
-        risk_analyzer = RiskAnalyzer(config)
-        await risk_analyzer.initialize()
-        
-        progress.update(task1, completed=True)
-        progress.update(task2, completed=True)
-        
-        # Fetch SEC reports
-        task3 = progress.add_task(f"Fetching {report_type} reports for {ticker}...", total=None)
-        try:
-            reports = await sec_client.get_company_reports(ticker, report_type)
-            progress.update(task3, completed=True)
+    sec_client = SECClient(config, cache_manager)
+    risk_analyzer = RiskAnalyzer(config, cache_manager)
+    fetch_task = None
+    
+    try:
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            console=console,
+        ) as progress:
             
-            if not reports:
-                console.print(f"[red]No {report_type} reports found for {ticker}[/red]")
-                return
+            # Initialize components; the report fetch only needs the shared
+            # cache, so it runs while the Bedrock client is being set up
+            task1 = progress.add_task("Initializing SEC client...", total=None)
+            await sec_client.initialize()
+            progress.update(task1, completed=True)
+            
+            task3 = progress.add_task(f"Fetching {report_type} reports for {ticker}...", total=None)
+            fetch_task = asyncio.create_task(sec_client.get_company_reports(ticker, report_type))
+            
+            task2 = progress.add_task("Initializing AI risk analyzer...", total=None)
+            await risk_analyzer.initialize()
+            progress.update(task2, completed=True)
+            
+            # Fetch SEC reports
+            try:
+                reports = await fetch_task
+                progress.update(task3, completed=True)
                 
-        except Exception as e:
-            progress.update(task3, completed=True)
-            console.print(f"[red]Error fetching reports: {e}[/red]")
-            return
-        
-        # Analyze risks
-        task4 = progress.add_task("Analyzing risks with AI agent...", total=None)
-        try:
-            analysis_results = await risk_analyzer.analyze_reports(reports, ticker, report_type)
-            progress.update(task4, completed=True)
-        except Exception as e:
-            progress.update(task4, completed=True)
-            console.print(f"[red]Error during analysis: {e}[/red]")
-            return
-        
-        # Generate report
-        task5 = progress.add_task("Generating analysis report...", total=None)
-        report_generator = ReportGenerator(config)
-        report = report_generator.generate_report(analysis_results, ticker, report_type)
-        progress.update(task5, completed=True)
+                if not reports:
+                    console.print(f"[red]No {report_type} reports found for {ticker}[/red]")
+                    return
+                    
+            except Exception as e:
+                progress.update(task3, completed=True)
+                console.print(f"[red]Error fetching reports: {e}[/red]")
+                return
+            
+            # Analyze risks
+            task4 = progress.add_task("Analyzing risks with AI agent...", total=None)
+            try:
+                analysis_results = await risk_analyzer.analyze_reports(reports, ticker, report_type)
+                progress.update(task4, completed=True)
+            except Exception as e:
+                progress.update(task4, completed=True)
+                console.print(f"[red]Error during analysis: {e}[/red]")
+                return
+            
+            # Generate report
+            task5 = progress.add_task("Generating analysis report...", total=None)
+            report_generator = ReportGenerator(config)
+            report = report_generator.generate_report(analysis_results, ticker, report_type)
+            progress.update(task5, completed=True)
+    finally:
+        if fetch_task is not None and not fetch_task.done():
+            fetch_task.cancel()
+        await sec_client.close()
+        await risk_analyzer.close()
+        await cache_manager.close()
     
     # Display results
     _display_results(analysis_results, ticker)
@@ -164,45 +189,51 @@ def filings(ctx, ticker: str, limit: int):
     
     console.print(f"[bold]Recent SEC Filings for {ticker.upper()}[/bold]")
     
-    asyncio.run(_list_filings(config, ticker, limit))
+    asyncio.run(_list_filings(config, _get_cache_manager(ctx), ticker, limit))
 
 
-async def _list_filings(config: Config, ticker: str, limit: int):
+async def _list_filings(config: Config, cache_manager: CacheManager, ticker: str, limit: int):
     """List recent filings for a company."""
-    sec_client = SECClient(config)
-    await sec_client.initialize()
+    from .sec_client import SECClient
     
+    sec_client = SECClient(config, cache_manager)
     try:
-        filings = await sec_client.get_recent_filings(ticker, limit)
-        
-        if not filings:
-            console.print(f"[red]No filings found for {ticker}[/red]")
-            return
-        
-        table = Table()
-        table.add_column("Date", style="cyan")
-        table.add_column("Form Type", style="magenta")
-        table.add_column("Description", style="green")
-        table.add_column("URL", style="blue")
-        
-        for filing in filings:
-            table.add_row(
-                filing.get('date', 'N/A'),
-                filing.get('form_type', 'N/A'),
-                filing.get('description', 'N/A')[:50] + "...",
-                filing.get('url', 'N/A')[:50] + "..."
-            )
-        
-        console.print(table)
+        await sec_client.initialize()
         
-    except Exception as e:
-        console.print(f"[red]Error fetching filings: {e}[/red]")
+        try:
+            filings = await sec_client.get_recent_filings(ticker, limit)
+            
+            if not filings:
+                console.print(f"[red]No filings found for {ticker}[/red]")
+                return
+            
+            table = Table()
+            table.add_column("Date", style="cyan")
+            table.add_column("Form Type", style="magenta")
+            table.add_column("Description", style="green")
+            table.add_column("URL", style="blue")
+            
+            for filing in filings:
+                table.add_row(
+                    filing.get('date', 'N/A'),
+                    filing.get('form_type', 'N/A'),
+                    filing.get('description', 'N/A')[:50] + "...",
+                    filing.get('url', 'N/A')[:50] + "..."
+                )
+            
+            console.print(table)
+            
+        except Exception as e:
+            console.print(f"[red]Error fetching filings: {e}[/red]")
+    finally:
+        await sec_client.close()
+        await cache_manager.close()
 
 
 @cli.command()
 def config():
     """Show current configuration."""
-    config_obj = Config()
+    config_obj = get_config()
     
     table = Table(title="Configuration")
     table.add_column("Setting", style="cyan")
@@ -218,6 +249,8 @@ def config():
     table.add_row("Cache Expiry Days", str(config_obj.cache_expiry_days))
     table.add_row("Cache Compression", str(config_obj.cache_compression))
     table.add_row("Cache Max Size (MB)", str(config_obj.cache_max_size_mb))
+    table.add_row("Cache Dictionary Path", config_obj.cache_dict_path)
+    table.add_row("Cache Documents Dir", config_obj.cache_docs_dir)
     
     console.print(table)
 
@@ -232,8 +265,7 @@ def cache():
 @click.pass_context
 def stats(ctx):
     """Show cache statistics."""
-    config_obj = ctx.obj['config']
-    asyncio.run(_show_cache_stats(config_obj))
+    asyncio.run(_show_cache_stats(_get_cache_manager(ctx)))
 
 
 @cache.command()
@@ -243,110 +275,147 @@ def stats(ctx):
 @click.pass_context
 def clear(ctx, table):
     """Clear cache data."""
-    config_obj = ctx.obj['config']
-    asyncio.run(_clear_cache(config_obj, table))
+    asyncio.run(_clear_cache(_get_cache_manager(ctx), table))
 
 
 @cache.command()
 @click.pass_context
 def cleanup(ctx):
     """Remove expired cache entries."""
-    config_obj = ctx.obj['config']
-    asyncio.run(_cleanup_cache(config_obj))
+    asyncio.run(_cleanup_cache(_get_cache_manager(ctx)))
+
+
+@cache.command(name='train-dict')
+@click.option('--samples', '-n', default=100, help='Max samples to draw from each cache table')
+@click.pass_context
+def train_dict(ctx, samples: int):
+    """Train a zstd compression dictionary from cached data."""
+    asyncio.run(_train_cache_dict(_get_cache_manager(ctx), samples))
 
 
-async def _show_cache_stats(config: Config):
+async def _show_cache_stats(cache_manager: CacheManager):
     """Show cache statistics."""
-    cache_manager = CacheManager(config)
-    await cache_manager.initialize()
-    
-    stats = await cache_manager.get_cache_stats()
-    
-    if not stats.get('cache_enabled', False):
-        console.print("[yellow]Cache is disabled[/yellow]")
-        return
-    
-    table = Table(title="Cache Statistics")
-    table.add_column("Metric", style="cyan")
-    table.add_column("Value", style="green")
-    
-    table.add_row("Cache Enabled", str(stats.get('cache_enabled', False)))
-    table.add_row("Database Size", f"{stats.get('db_size_mb', 0)} MB")
-    table.add_row("Company CIKs", str(stats.get('company_ciks_count', 0)))
-    table.add_row("Filing Metadata", str(stats.get('filing_metadata_count', 0)))
-    table.add_row("Document Content", str(stats.get('document_content_count', 0)))
-    table.add_row("Analysis Results", str(stats.get('analysis_results_count', 0)))
-    
-    if stats.get('oldest_entry'):
-        table.add_row("Oldest Entry", stats['oldest_entry'])
-    if stats.get('newest_entry'):
-        table.add_row("Newest Entry", stats['newest_entry'])
-    
-    console.print(table)
+    try:
+        await cache_manager.initialize()
+        
+        stats = await cache_manager.get_cache_stats()
+        
+        if not stats.get('cache_enabled', False):
+            console.print("[yellow]Cache is disabled[/yellow]")
+            return
+        
+        table = Table(title="Cache Statistics")
+        table.add_column("Metric", style="cyan")
+        table.add_column("Value", style="green")
+        
+        table.add_row("Cache Enabled", str(stats.get('cache_enabled', False)))
+        table.add_row("Database Size", f"{stats.get('db_size_mb', 0)} MB")
+        table.add_row("Documents Size", f"{stats.get('docs_size_mb', 0)} MB")
+        table.add_row("Company CIKs", str(stats.get('company_ciks_count', 0)))
+        table.add_row("Filing Metadata", str(stats.get('filing_metadata_count', 0)))
+        table.add_row("Document Content", str(stats.get('document_content_count', 0)))
+        table.add_row("Analysis Results", str(stats.get('analysis_results_count', 0)))
+        table.add_row("Sub-analyses", str(stats.get('sub_analysis_count', 0)))
+        
+        if stats.get('oldest_entry'):
+            table.add_row("Oldest Entry", stats['oldest_entry'])
+        if stats.get('newest_entry'):
+            table.add_row("Newest Entry", stats['newest_entry'])
+        
+        console.print(table)
+    finally:
+        await cache_manager.close()
 
 
-async def _clear_cache(config: Config, table: str):
+async def _train_cache_dict(cache_manager: CacheManager, samples: int):
+    """Train a zstd compression dictionary from cached data."""
+    try:
+        await cache_manager.initialize()
+        
+        try:
+            result = await cache_manager.build_dictionary(max_samples=samples)
+        except Exception as e:
+            console.print(f"[red]Error training dictionary: {e}[/red]")
+            return
+        
+        if not result.get('cache_enabled', True):
+            console.print("[yellow]Cache is disabled[/yellow]")
+            return
+        
+        console.print(
+            f"[green]Trained {result['dict_size']} byte dictionary from {result['samples']} samples "
+            f"and saved it to {result['dict_path']}[/green]"
+        )
+    finally:
+        await cache_manager.close()
+
+
+async def _clear_cache(cache_manager: CacheManager, table: str):
     """Clear cache data."""
-    cache_manager = CacheManager(config)
-    await cache_manager.initialize()
-    
-    if table == 'all':
-        await cache_manager.clear_cache()
-        console.print("[green]All cache data cleared[/green]")
-    else:
-        await cache_manager.clear_cache(table)
-        console.print(f"[green]Cache table '{table}' cleared[/green]")
+    try:
+        await cache_manager.initialize()
+        
+        if table == 'all':
+            await cache_manager.clear_cache()
+            console.print("[green]All cache data cleared[/green]")
+        else:
+            await cache_manager.clear_cache(table)
+            console.print(f"[green]Cache table '{table}' cleared[/green]")
+    finally:
+        await cache_manager.close()
 
 
 @cache.command()
 @click.pass_context
 def performance(ctx):
     """Show detailed cache performance statistics."""
-    config_obj = ctx.obj['config']
-    asyncio.run(_show_cache_performance(config_obj))
+    asyncio.run(_show_cache_performance(_get_cache_manager(ctx)))
 
 
-async def _show_cache_performance(config: Config):
+async def _show_cache_performance(cache_manager: CacheManager):
     """Show detailed cache performance statistics."""
-    cache_manager = CacheManager(config)
-    await cache_manager.initialize()
-    
-    perf_stats = await cache_manager.get_performance_stats()
-    
-    if not perf_stats.get('cache_enabled', False):
-        console.print("[yellow]Cache is disabled[/yellow]")
-        return
-    
-    # Overall performance
-    console.print(Panel(
-        f"[bold]Overall Hit Rate:[/bold] {perf_stats.get('overall_hit_rate', 0)}%\n"
-        f"[bold]Session Hits:[/bold] {perf_stats.get('session_hits', 0)}\n"
-        f"[bold]Session Misses:[/bold] {perf_stats.get('session_misses', 0)}",
-        title="Cache Performance Summary"
-    ))
-    
-    # Detailed performance by operation
-    performance_data = perf_stats.get('performance', {})
-    if performance_data:
-        table = Table(title="Performance by Operation")
-        table.add_column("Operation", style="cyan")
-        table.add_column("Hit Rate", style="green")
-        table.add_column("Total Requests", style="blue")
-        table.add_column("Avg Response (ms)", style="yellow")
-        table.add_column("Last Updated", style="magenta")
+    try:
+        await cache_manager.initialize()
         
-        for operation, data in performance_data.items():
-            table.add_row(
-                operation.replace('_', ' ').title(),
-                f"{data['hit_rate']}%",
-                str(data['total_requests']),
-                str(data['avg_response_time_ms']),
-                data['last_updated'][:19] if data['last_updated'] else 'N/A'
-            )
+        perf_stats = await cache_manager.get_performance_stats()
         
-        console.print(table)
-    else:
-        console.print("[yellow]No performance data available yet[/yellow]")
+        if not perf_stats.get('cache_enabled', False):
+            console.print("[yellow]Cache is disabled[/yellow]")
+            return
+        
+        # Overall performance
+        console.print(Panel(
+            f"[bold]Overall Hit Rate:[/bold] {perf_stats.get('overall_hit_rate', 0)}%\n"
+            f"[bold]Session Hits:[/bold] {perf_stats.get('session_hits', 0)}\n"
+            f"[bold]Session Misses:[/bold] {perf_stats.get('session_misses', 0)}\n"
+            f"[bold]Memory Hits:[/bold] {sum(perf_stats.get('memory_hits', {}).values())}",
+            title="Cache Performance Summary"
+        ))
+        
+        # Detailed performance by operation
+        performance_data = perf_stats.get('performance', {})
+        if performance_data:
+            table = Table(title="Performance by Operation")
+            table.add_column("Operation", style="cyan")
+            table.add_column("Hit Rate", style="green")
+            table.add_column("Total Requests", style="blue")
+            table.add_column("Avg Response (ms)", style="yellow")
+            table.add_column("Last Updated", style="magenta")
+            
+            for operation, data in performance_data.items():
+                table.add_row(
+                    operation.replace('_', ' ').title(),
+                    f"{data['hit_rate']}%",
+                    str(data['total_requests']),
+                    str(data['avg_response_time_ms']),
+                    data['last_updated'][:19] if data['last_updated'] else 'N/A'
+                )
+            
+            console.print(table)
+        else:
+            console.print("[yellow]No performance data available yet[/yellow]")
+    finally:
+        await cache_manager.close()
 
 
 def main():
@@ -368,41 +437,52 @@ if __name__ == '__main__':
 def warm(ctx, tickers, report_type):
     """Warm cache by pre-loading data for specified tickers."""
     config_obj = ctx.obj['config']
-    asyncio.run(_warm_cache(config_obj, tickers, report_type))
+    asyncio.run(_warm_cache(config_obj, _get_cache_manager(ctx), tickers, report_type))
 
 
-async def _warm_cache(config: Config, tickers: tuple, report_type: str):
+async def _warm_cache(config: Config, cache_manager: CacheManager, tickers: tuple, report_type: str):
     """Warm cache by pre-loading SEC data."""
-    console.print(f"[bold blue]Warming cache for {len(tickers)} companies...[/bold blue]")
+    from .sec_client import SECClient
     
-    sec_client = SECClient(config)
-    await sec_client.initialize()
+    console.print(f"[bold blue]Warming cache for {len(tickers)} companies...[/bold blue]")
     
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        console=console,
-    ) as progress:
+    sec_client = SECClient(config, cache_manager)
+    try:
+        await sec_client.initialize()
         
-        for ticker in tickers:
-            task = progress.add_task(f"Loading data for {ticker}...", total=None)
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            console=console,
+        ) as progress:
             
-            try:
-                # This will cache CIK and filing metadata
-                reports = await sec_client.get_company_reports(ticker, report_type)
-                progress.update(task, completed=True)
-                console.print(f"[green]✓ Cached {len(reports)} reports for {ticker}[/green]")
-                
-            except Exception as e:
-                progress.update(task, completed=True)
-                console.print(f"[red]✗ Error caching {ticker}: {e}[/red]")
-    
-    console.print("[bold green]Cache warming completed![/bold green]")
+            async def warm_ticker(ticker: str):
+                task = progress.add_task(f"Loading data for {ticker}...", total=None)
+                try:
+                    # Cache writes are batched and flushed once all tickers are loaded
+                    reports = await sec_client.get_company_reports(ticker, report_type, defer_cache_write=True)
+                    progress.update(task, completed=True)
+                    console.print(f"[green]✓ Cached {len(reports)} reports for {ticker}[/green]")
+                    
+                except Exception as e:
+                    progress.update(task, completed=True)
+                    console.print(f"[red]✗ Error caching {ticker}: {e}[/red]")
+            
+            # The client bounds how many tickers load at once
+            await sec_client.gather_tickers(list(tickers), warm_ticker)
+        
+        await sec_client.flush_deferred_cache()
+        console.print("[bold green]Cache warming completed![/bold green]")
+    finally:
+        await sec_client.close()
+        await cache_manager.close()
 
-async def _cleanup_cache(config: Config):
+async def _cleanup_cache(cache_manager: CacheManager):
     """Remove expired cache entries."""
-    cache_manager = CacheManager(config)
-    await cache_manager.initialize()
-    
-    await cache_manager.cleanup_expired_cache()
-    console.print("[green]Expired cache entries removed[/green]")
\ No newline at end of file
+    try:
+        await cache_manager.initialize()
+        
+        await cache_manager.cleanup_expired_cache()
+        console.print("[green]Expired cache entries removed[/green]")
+    finally:
+        await cache_manager.close()
\ No newline at end of file
@@ -1,13 +1,23 @@
 """Configuration management for SEC Analyzer."""
 
 import os
+from functools import lru_cache
 from typing import Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Settings that can be overridden from the environment
+ENV_OVERRIDES = {
+    "aws_region": "SEC_ANALYZER_AWS_REGION",
+    "bedrock_model": "SEC_ANALYZER_BEDROCK_MODEL",
+    "user_agent": "SEC_ANALYZER_USER_AGENT",
+    "cache_docs_dir": "SEC_ANALYZER_CACHE_DOCS_DIR",
+    "cache_dict_path": "SEC_ANALYZER_CACHE_DICT_PATH",
+}
+
 
 class Config(BaseModel):
     """Configuration settings for the SEC Analyzer."""
@@ -49,17 +59,20 @@ class Config(BaseModel):
     cache_expiry_days: int = Field(default=7)  # Cache SEC data for 7 days
     cache_compression: bool = Field(default=True)  # Compress cached content
     cache_max_size_mb: int = Field(default=500)  # Max cache size in MB
+    cache_dict_path: str = Field(default="sec_analyzer_cache_dict.zstd")  # Trained zstd dictionary
+    cache_docs_dir: str = Field(default="sec_analyzer_cache_docs")  # Document content files
     
-    class Config:
-        env_prefix = "SEC_ANALYZER_"
+    # Settings are read once and shared, so they must not change afterwards
+    model_config = ConfigDict(frozen=True)
     
     def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        
         # Override with environment variables if present
-        self.aws_region = os.getenv("SEC_ANALYZER_AWS_REGION", self.aws_region)
-        self.bedrock_model = os.getenv("SEC_ANALYZER_BEDROCK_MODEL", self.bedrock_model)
-        self.user_agent = os.getenv("SEC_ANALYZER_USER_AGENT", self.user_agent)
+        for field, env_var in ENV_OVERRIDES.items():
+            value = os.getenv(env_var)
+            if value is not None:
+                kwargs[field] = value
+        
+        super().__init__(**kwargs)
     
     def get_bedrock_client_config(self) -> dict:
         """Get configuration for AWS Bedrock client."""
@@ -73,4 +86,9 @@ class Config(BaseModel):
         return {
             "User-Agent": self.user_agent,
             "Accept": "application/json"
-        }
\ No newline at end of file
+        }
+
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Return the process-wide configuration, built on first use."""
+    return Config()
@@ -67,7 +67,7 @@ class ReportGenerator:
 **Analysis Method:** AI-powered analysis using Strands Agents framework
 **Models Used:** {self.config.bedrock_model}
 **Data Sources:** SEC EDGAR filings
-**Analysis Timestamp:** {analysis_results.get('analysis_timestamp', 'N/A')}
+**Analysis Timestamp:** {self._format_timestamp(analysis_results.get('analysis_timestamp', 'N/A'))}
 
 ---
 
@@ -85,6 +85,12 @@ investigation.
         
         return report
     
+    def _format_timestamp(self, value: Any) -> str:
+        """Format an epoch-seconds timestamp; other values are shown as-is."""
+        if isinstance(value, int):
+            return datetime.fromtimestamp(value).strftime("%Y-%m-%d %H:%M:%S")
+        return str(value)
+    
     def _generate_executive_summary(self, results: Dict[str, Any]) -> str:
         """Generate executive summary section."""
         
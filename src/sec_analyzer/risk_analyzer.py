@@ -1,75 +1,36 @@
 """AI-powered risk analysis using AWS Bedrock directly."""
 
-import json
+import asyncio
+import io
+import re
+import time
 import boto3
-import hashlib
-from datetime import datetime
-from typing import List, Dict, Any
+import orjson
+import xxhash
+from botocore.config import Config as BotocoreConfig
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 
 from .config import Config
 from .cache_manager import CacheManager
 
+# Candidate starts of a JSON object in a model response
+_JSON_OBJECT_START = re.compile(r'\{')
 
-class RiskAnalyzer:
-    """AI agent for analyzing SEC reports and assessing risks."""
-    
-    def __init__(self, config: Config):
-        self.config = config
-        self.bedrock_client = boto3.client(
-            'bedrock-runtime',
-            region_name=config.aws_region
-        )
-        
-        # Initialize cache
-        self.cache = CacheManager(config)
-    
-    async def initialize(self):
-        """Initialize the risk analyzer and cache."""
-        await self.cache.initialize()
-    
-    async def _call_bedrock(self, prompt: str) -> str:
-        """Make a direct call to AWS Bedrock."""
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": self.config.agent_max_tokens,
-            "temperature": self.config.agent_temperature,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
-        }
-        
-        response = self.bedrock_client.invoke_model(
-            modelId=self.config.bedrock_model,
-            body=json.dumps(request_body),
-            contentType='application/json'
-        )
-        
-        response_body = json.loads(response['body'].read())
-        
-        if 'content' in response_body and response_body['content']:
-            return response_body['content'][0]['text']
-        else:
-            return "No response generated"
-    
-    async def analyze_reports(self, reports: List[Dict], ticker: str, report_type: str = "10-K") -> Dict[str, Any]:
-        """Analyze SEC reports using direct Bedrock calls to assess various risk categories."""
-        
-        # Prepare report content for analysis
-        report_content = self._prepare_report_content(reports)
-        
-        # Generate content hash for caching
-        content_hash = hashlib.md5(report_content.encode()).hexdigest()
-        
-        # Try to get cached analysis results
-        cached_analysis = await self.cache.get_analysis_results(ticker, report_type, content_hash)
-        if cached_analysis:
-            return cached_analysis
-        
-        # Analyze with financial risk assessment
-        financial_prompt = f"""You are a financial risk analyst. Analyze the SEC filings for {ticker} and assess financial risks:
+# Bedrock client settings: enough pooled connections for concurrent
+# sub-analyses, with adaptive retries to back off on throttling
+BEDROCK_CLIENT_CONFIG = BotocoreConfig(
+    max_pool_connections=32,
+    retries={'max_attempts': 3, 'mode': 'adaptive'}
+)
+
+# Keywords marking a line of a free-text response as a risk concern
+_CONCERN_KEYWORD = re.compile(r'risk|concern|issue|threat')
+
+
+# Prompt templates, filled in with str.format per analysis; literal braces
+# in the JSON examples are doubled
+_FINANCIAL_PROMPT = """You are a financial risk analyst. Analyze the SEC filings for {ticker} and assess financial risks:
         
         Report Content:
         {report_content}
@@ -92,11 +53,8 @@ class RiskAnalyzer:
             "overall_financial_score": X,
             "key_concerns": ["concern1", "concern2", "concern3"]
         }}"""
-        
-        financial_analysis = await self._call_bedrock(financial_prompt)
-        
-        # Analyze with operational risk assessment
-        operational_prompt = f"""You are an operational risk analyst. Analyze the SEC filings for {ticker} and assess operational risks:
+
+_OPERATIONAL_PROMPT = """You are an operational risk analyst. Analyze the SEC filings for {ticker} and assess operational risks:
         
         Report Content:
         {report_content}
@@ -121,11 +79,8 @@ class RiskAnalyzer:
             "overall_operational_score": X,
             "key_concerns": ["concern1", "concern2", "concern3"]
         }}"""
-        
-        operational_analysis = await self._call_bedrock(operational_prompt)
-        
-        # Analyze with strategic risk assessment
-        strategic_prompt = f"""You are a strategic risk analyst. Analyze the SEC filings for {ticker} and assess strategic risks:
+
+_STRATEGIC_PROMPT = """You are a strategic risk analyst. Analyze the SEC filings for {ticker} and assess strategic risks:
         
         Report Content:
         {report_content}
@@ -150,11 +105,8 @@ class RiskAnalyzer:
             "overall_strategic_score": X,
             "key_concerns": ["concern1", "concern2", "concern3"]
         }}"""
-        
-        strategic_analysis = await self._call_bedrock(strategic_prompt)
-        
-        # Synthesize results
-        synthesis_prompt = f"""You are a senior risk analyst. Synthesize the risk assessments from financial, operational, and strategic 
+
+_SYNTHESIS_PROMPT = """You are a senior risk analyst. Synthesize the risk assessments from financial, operational, and strategic 
         analysts for {ticker} into a comprehensive risk profile:
         
         Financial Risk Analysis: {financial_analysis}
@@ -175,34 +127,242 @@ class RiskAnalyzer:
             "top_risk_concerns": ["concern1", "concern2", "concern3", "concern4", "concern5"],
             "risk_trend": "Improving/Stable/Deteriorating",
             "regulatory_implications": "detailed analysis for regulatory oversight",
-            "monitoring_priorities": ["priority1", "priority2", "priority3"],
-            "financial_analysis": {financial_analysis},
-            "operational_analysis": {operational_analysis},
-            "strategic_analysis": {strategic_analysis}
+            "monitoring_priorities": ["priority1", "priority2", "priority3"]
         }}"""
+
+
+@lru_cache(maxsize=4)
+def _get_bedrock_client(region: str):
+    """Return the process-wide Bedrock runtime client for ``region``.
+    
+    Sharing one client keeps its credentials and TLS connection pool warm
+    across RiskAnalyzer instances. boto3 clients are thread-safe, but the
+    default session is not, so the client comes from its own session.
+    """
+    return boto3.Session().client(
+        'bedrock-runtime',
+        region_name=region,
+        config=BEDROCK_CLIENT_CONFIG
+    )
+
+
+def _find_json_object_end(text: str, start: int) -> int:
+    """Return the index of the brace closing the object opened at ``start``.
+    
+    A single forward scan that tracks nesting depth and skips braces inside
+    string literals; returns -1 if the object is never closed.
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return index
+    
+    return -1
+
+
+class RiskAnalyzer:
+    """AI agent for analyzing SEC reports and assessing risks."""
+    
+    def __init__(self, config: Config, cache: Optional[CacheManager] = None):
+        self.config = config
+        # Created in initialize(), off the event loop: resolving credentials
+        # and loading botocore models is slow blocking work
+        self.bedrock_client = None
+        
+        # Initialize cache; a cache passed in is shared and closed by its owner
+        self._owns_cache = cache is None
+        self.cache = cache if cache is not None else CacheManager(config)
+    
+    async def initialize(self):
+        """Initialize the risk analyzer, its Bedrock client and cache."""
+        if self.bedrock_client is None:
+            self.bedrock_client = await asyncio.to_thread(_get_bedrock_client, self.config.aws_region)
+        await self.cache.initialize()
+    
+    async def close(self):
+        """Release the risk analyzer's cache connection if it owns it."""
+        if self._owns_cache:
+            await self.cache.close()
+    
+    def _invoke_model(self, body: bytes) -> str:
+        """Invoke the Bedrock model and collect its streamed text (blocking).
+        
+        Streaming lets each chunk be decoded as it arrives instead of reading
+        and parsing the whole response body after the model has finished.
+        """
+        response = self.bedrock_client.invoke_model_with_response_stream(
+            modelId=self.config.bedrock_model,
+            body=body,
+            contentType='application/json'
+        )
+        
+        text = io.StringIO()
+        for event in response['body']:
+            chunk = event.get('chunk')
+            if chunk is None:
+                continue
+            message = orjson.loads(chunk['bytes'])
+            # Only the first content block's text, as with a non-streamed response
+            if message.get('type') == 'content_block_delta' and message.get('index', 0) == 0:
+                text.write(message['delta'].get('text', ''))
+        
+        return text.getvalue()
+    
+    async def _call_bedrock(self, prompt: str) -> str:
+        """Make a direct call to AWS Bedrock."""
+        request_body = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": self.config.agent_max_tokens,
+            "temperature": self.config.agent_temperature,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        }
+        
+        # boto3 is blocking; run the call in a worker thread so concurrent
+        # Bedrock requests actually overlap
+        response_text = await asyncio.to_thread(self._invoke_model, orjson.dumps(request_body))
+        
+        if response_text:
+            return response_text
+        else:
+            return "No response generated"
+    
+    async def _cached_call(self, ticker: str, report_type: str, kind: str, content_hash: str, prompt: str,
+                           fresh: List[Tuple[str, str, str]]) -> str:
+        """Call Bedrock for one sub-analysis unless its response is already cached.
+        
+        New responses are appended to ``fresh`` as ``(kind, content_hash,
+        response)`` for _store_sub_analyses to write in one transaction.
+        """
+        cached = await self.cache.get_sub_analysis(ticker, report_type, kind, content_hash)
+        if cached is not None:
+            return cached
+        
+        response = await self._call_bedrock(prompt)
+        fresh.append((kind, content_hash, response))
+        return response
+    
+    async def _store_sub_analyses(self, ticker: str, report_type: str, fresh: List[Tuple[str, str, str]]):
+        """Cache newly fetched sub-analysis responses in a single transaction."""
+        if not fresh:
+            return
+        async with self.cache.transaction():
+            for kind, content_hash, response in fresh:
+                await self.cache.cache_sub_analysis(ticker, report_type, kind, content_hash, response)
+        fresh.clear()
+    
+    async def analyze_reports(self, reports: List[Dict], ticker: str, report_type: str = "10-K") -> Dict[str, Any]:
+        """Analyze SEC reports using direct Bedrock calls to assess various risk categories."""
+        
+        # Prepare report content for analysis, hashed for caching in the same pass
+        report_content, content_hash = self._prepare_report_content(reports)
+        
+        # Try to get cached analysis results
+        cached_analysis = await self.cache.get_analysis_results(ticker, report_type, content_hash)
+        if cached_analysis:
+            return cached_analysis
+        
+        # Analyze with financial risk assessment
+        financial_prompt = _FINANCIAL_PROMPT.format(ticker=ticker, report_content=report_content)
+        
+        # Analyze with operational risk assessment
+        operational_prompt = _OPERATIONAL_PROMPT.format(ticker=ticker, report_content=report_content)
+        
+        # Analyze with strategic risk assessment
+        strategic_prompt = _STRATEGIC_PROMPT.format(ticker=ticker, report_content=report_content)
+        
+        # The three assessments are independent, so request them concurrently.
+        # Each is cached on its own so a partial hit skips the finished calls.
+        fresh: List[Tuple[str, str, str]] = []
+        results = await asyncio.gather(
+            self._cached_call(ticker, report_type, "financial", content_hash, financial_prompt, fresh),
+            self._cached_call(ticker, report_type, "operational", content_hash, operational_prompt, fresh),
+            self._cached_call(ticker, report_type, "strategic", content_hash, strategic_prompt, fresh),
+            return_exceptions=True
+        )
+        # Keep the responses that did arrive even if another call failed
+        await self._store_sub_analyses(ticker, report_type, fresh)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        financial_analysis, operational_analysis, strategic_analysis = results
         
-        synthesis_result = await self._call_bedrock(synthesis_prompt)
+        # Synthesize results
+        synthesis_prompt = _SYNTHESIS_PROMPT.format(
+            ticker=ticker,
+            financial_analysis=financial_analysis,
+            operational_analysis=operational_analysis,
+            strategic_analysis=strategic_analysis
+        )
         
-        # Parse and structure results
+        # Keyed on the sub-analyses so identical inputs reuse the synthesis even
+        # when the report content hash differs
+        synthesis_hash = xxhash.xxh3_128_hexdigest(
+            (financial_analysis + operational_analysis + strategic_analysis).encode()
+        )
+        synthesis_result = await self._cached_call(ticker, report_type, "synthesis", synthesis_hash, synthesis_prompt, fresh)
+        
+        # Parse and structure results. The sub-analyses are attached locally
+        # rather than having the model echo them back in its response.
         analysis_results = self._parse_analysis_results(synthesis_result, ticker)
+        analysis_results['financial_analysis'] = self._parse_sub_analysis(financial_analysis)
+        analysis_results['operational_analysis'] = self._parse_sub_analysis(operational_analysis)
+        analysis_results['strategic_analysis'] = self._parse_sub_analysis(strategic_analysis)
         
-        # Cache the analysis results
-        await self.cache.cache_analysis_results(ticker, report_type, content_hash, analysis_results)
+        # Cache the synthesis response and the analysis results together
+        async with self.cache.transaction():
+            await self._store_sub_analyses(ticker, report_type, fresh)
+            await self.cache.cache_analysis_results(ticker, report_type, content_hash, analysis_results)
         
         return analysis_results
     
-    def _prepare_report_content(self, reports: List[Dict]) -> str:
-        """Prepare and clean report content for analysis."""
-        content_parts = []
+    def _prepare_report_content(self, reports: List[Dict]) -> Tuple[str, str]:
+        """Prepare report content for analysis and compute its cache key.
+        
+        Each piece is written once to the output buffer and fed to the hasher,
+        instead of building per-report strings, joining them and hashing the
+        joined copy. The key is only a cache key, so a fast non-cryptographic
+        hash is enough.
+        """
+        writer = io.StringIO()
+        hasher = xxhash.xxh3_128()
+        separator = ""
         
         for report in reports:
             if 'content' in report and report['content']:
-                content_parts.append(f"""
-=== {report['form_type']} Filing - {report['filing_date']} ===
-{report['content'][:15000]}  # Limit content per report
-""")
-        
-        return "\n".join(content_parts)
+                pieces = (
+                    separator,
+                    f"\n=== {report['form_type']} Filing - {report['filing_date']} ===\n",
+                    report['content'][:15000],
+                    "  # Limit content per report\n",
+                )
+                for piece in pieces:
+                    writer.write(piece)
+                    hasher.update(piece.encode())
+                separator = "\n"
+        
+        return writer.getvalue(), hasher.hexdigest()
     
     def _parse_analysis_results(self, result: str, ticker: str) -> Dict[str, Any]:
         """Parse and structure the analysis results from Bedrock."""
@@ -222,7 +382,8 @@ class RiskAnalyzer:
             
             # Add metadata
             structured_result['ticker'] = ticker
-            structured_result['analysis_timestamp'] = str(datetime.now())
+            # Epoch seconds, like the cache's timestamps; formatted for display
+            structured_result['analysis_timestamp'] = int(time.time())
             structured_result['raw_analysis'] = result
             
             return structured_result
@@ -241,45 +402,79 @@ class RiskAnalyzer:
     def _extract_structured_data(self, text: str) -> Dict[str, Any]:
         """Extract structured data from AI agent response."""
         
-        # Try to find JSON in the response
-        import re
+        structured = self._find_json_object(text)
+        if structured is not None:
+            return structured
         
-        json_pattern = r'\{.*\}'
-        matches = re.findall(json_pattern, text, re.DOTALL)
+        # If no JSON found, create structured response from text
+        return self._create_structured_from_text(text)
+    
+    def _parse_sub_analysis(self, text: str) -> Any:
+        """Return a sub-analysis response as parsed JSON, or as-is if it has none."""
+        structured = self._find_json_object(text)
+        return structured if structured is not None else text
+    
+    def _find_json_object(self, text: str) -> Optional[Any]:
+        """Return the first JSON object in a model response, or None."""
         
-        for match in matches:
+        # Fast path: the response is just the object, possibly in a code fence
+        stripped = text.strip().removeprefix('```json').removeprefix('```').removesuffix('```').strip()
+        if stripped.startswith('{'):
             try:
-                return json.loads(match)
-            except json.JSONDecodeError:
-                continue
+                return orjson.loads(stripped)
+            except orjson.JSONDecodeError:
+                pass
+        
+        # Otherwise the first top-level balanced object that parses. Each
+        # character is scanned once, so long responses stay linear instead of
+        # backtracking like a greedy regex.
+        match = _JSON_OBJECT_START.search(text)
+        while match:
+            end = _find_json_object_end(text, match.start())
+            if end == -1:
+                break  # Unclosed object runs to the end of the response
+            try:
+                return orjson.loads(text[match.start():end + 1])
+            except orjson.JSONDecodeError:
+                match = _JSON_OBJECT_START.search(text, end + 1)
         
-        # If no JSON found, create structured response from text
-        return self._create_structured_from_text(text)
+        return None
     
     def _create_structured_from_text(self, text: str) -> Dict[str, Any]:
         """Create structured response from unstructured text."""
         
-        # Extract key insights using simple text processing
-        lines = text.split('\n')
+        # Extract key insights by searching a single lowercased copy of the
+        # text for keywords, instead of splitting it into lines and
+        # lowercasing each one. U+0130 is the only character lower() turns
+        # into two, which would shift offsets; it cannot complete a keyword,
+        # so it is blanked out first.
+        lowered = text.replace('\u0130', ' ').lower()
         concerns = []
         risk_categories = {}
         
-        for line in lines:
-            line = line.strip()
-            if line and len(line) > 20:
-                if any(keyword in line.lower() for keyword in ['risk', 'concern', 'issue', 'threat']):
-                    concerns.append(line[:200])  # Limit length
-                    
-                if len(concerns) >= 10:  # Limit number of concerns
-                    break
+        position = 0
+        while len(concerns) < 10:  # Limit number of concerns
+            match = _CONCERN_KEYWORD.search(lowered, position)
+            if not match:
+                break
+            
+            line_start = lowered.rfind('\n', 0, match.start()) + 1
+            line_end = lowered.find('\n', match.end())
+            if line_end == -1:
+                line_end = len(lowered)
+            
+            line = text[line_start:line_end].strip()
+            if len(line) > 20:
+                concerns.append(line[:200])  # Limit length
+            position = line_end
         
         # Try to extract overall assessment
         overall_score = 'N/A'
         overall_level = 'Medium'  # Default
         
-        if 'high risk' in text.lower() or 'critical' in text.lower():
+        if 'high risk' in lowered or 'critical' in lowered:
             overall_level = 'High'
-        elif 'low risk' in text.lower():
+        elif 'low risk' in lowered:
             overall_level = 'Low'
         
         return {
@@ -1,23 +1,220 @@
 """SEC EDGAR API client for fetching company filings using edgartools."""
 
 import asyncio
-from typing import List, Dict, Optional
+import re
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Awaitable, Callable, List, Dict, Optional, Tuple, Union
 from datetime import datetime
+import threading
 import time
-import hashlib
 
 from edgar import Company, Filing, get_filings, set_identity
 
+try:
+    # Installed with edgartools; the regex fallback below covers its absence
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:  # pragma: no cover
+    lxml_html = None
+
 from .config import Config
 from .cache_manager import CacheManager
 
+# Filing downloads allowed in flight at once, kept well under SEC's
+# 10 requests per second
+MAX_CONCURRENT_DOWNLOADS = 5
+
+# Tickers looked up at once by the batch methods
+MAX_CONCURRENT_TICKERS = 8
+
+
+# Share of the HTML kept for parsing, relative to the text length wanted;
+# markup usually outweighs the text it wraps
+HTML_PARSE_RATIO = 4
+
+# Markup tags, for stripping HTML when lxml is unavailable
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+class TokenBucket:
+    """Thread-safe token bucket that paces blocking calls to a steady rate.
+    
+    Up to ``capacity`` calls may go out back to back; after that callers
+    sleep until tokens refill at ``rate`` per second. A rate of 0 or less
+    disables the limit.
+    """
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        # Waiters hold the lock while sleeping, so tokens go out one at a time
+        self._lock = threading.Lock()
+        self.rate = 0.0
+        # Starts full; configure() caps it at the capacity
+        self._tokens = float('inf')
+        self._updated = time.monotonic()
+        self.configure(rate, capacity)
+    
+    def configure(self, rate: float, capacity: Optional[float] = None):
+        """Change the rate and burst capacity, keeping the tokens already earned."""
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.capacity = capacity if capacity is not None else max(1.0, rate)
+            self._tokens = min(self.capacity, self._tokens)
+    
+    def _refill(self):
+        """Add the tokens earned since the last update; the lock must be held."""
+        now = time.monotonic()
+        if self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def acquire(self):
+        """Block until a request may be sent, then take its token."""
+        if self.rate <= 0:
+            return
+        
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                time.sleep((1 - self._tokens) / self.rate)
+                # The token that accrued while sleeping is the one taken
+                self._tokens = 1.0
+                self._updated = time.monotonic()
+            self._tokens -= 1
+
+
+# Paces every EDGAR request in the process. SEC's limit applies per client
+# host, and the lookups below are memoized process-wide, so one bucket is
+# shared; SECClient sets its rate from the config.
+_sec_rate_limiter = TokenBucket(10)
+
+
+def _html_to_text(html_content: str, max_length: int) -> str:
+    """Extract whitespace-normalized text from filing HTML.
+    
+    Only the start of the document that usually yields ``max_length``
+    characters is parsed; if markup outweighs that share (inline XBRL
+    headers, styled spans) the whole document is parsed instead.
+    """
+    prefix = html_content[:max_length * HTML_PARSE_RATIO]
+    text = _extract_html_text(prefix)
+    if len(text) < max_length and len(prefix) < len(html_content):
+        text = _extract_html_text(html_content)
+    return text[:max_length]
+
+
+def _extract_html_text(html_content: str) -> str:
+    """Extract whitespace-normalized text from an HTML string.
+    
+    lxml walks the DOM in C, which is much faster than regex stripping on
+    multi-megabyte filings and also decodes entities.
+    """
+    if lxml_html is None:
+        # str.split() collapses whitespace in C, faster than a regex pass
+        return ' '.join(_TAG_RE.sub(' ', html_content).split())
+    
+    try:
+        # Parse bytes so an XML declaration naming another encoding is ignored
+        root = lxml_html.document_fromstring(
+            html_content.encode('utf-8'), parser=lxml_html.HTMLParser(encoding='utf-8')
+        )
+    except etree.ParserError:
+        return ""  # Nothing but whitespace
+    
+    etree.strip_elements(root, etree.Comment, 'script', 'style', with_tail=False)
+    # Text nodes are joined with spaces so adjacent cells and blocks stay apart
+    return ' '.join(' '.join(root.itertext()).split())
+
+
+def _unwrap_arrow(value: Any) -> Any:
+    """Convert a pyarrow scalar to its Python value; other values pass through."""
+    try:
+        return value.as_py()
+    except AttributeError:
+        return value
+
+
+def _fmt_date(value: Any) -> Optional[str]:
+    """Format a filing date, which may be a pyarrow scalar, as YYYY-MM-DD."""
+    value = _unwrap_arrow(value)
+    try:
+        return value.strftime('%Y-%m-%d')
+    except AttributeError:
+        return str(value) if value else None
+
+
+def _filing_columns(filings: Any, limit: int) -> Optional[Tuple[list, list, list]]:
+    """Read form, filing date and accession number for the first ``limit`` filings.
+    
+    edgartools keeps filings in a pyarrow table; converting whole column
+    slices at once avoids building a Filing object and converting each of
+    its scalars per row. Returns None when ``filings`` is not table-backed.
+    """
+    # Duck-typed so pyarrow, which only arrives through edgartools, isn't
+    # imported here
+    table = getattr(filings, 'data', None)
+    try:
+        table = table.slice(0, limit)
+        return (
+            table.column('form').to_pylist(),
+            table.column('filing_date').to_pylist(),
+            table.column('accession_number').to_pylist(),
+        )
+    except (AttributeError, KeyError):
+        return None  # Not a table, or an unexpected layout; read the Filing objects instead
+
+
+@lru_cache(maxsize=1024)
+def _company(ticker: str) -> Company:
+    """Return the edgartools Company for an upper-cased ticker (blocking).
+    
+    Each Company() fetches the company's submissions JSON from EDGAR; the
+    result is kept for the life of the process.
+    """
+    _sec_rate_limiter.acquire()
+    return Company(ticker)
+
+
+def _company_facts(company: Company) -> Any:
+    """Download a company's XBRL facts (blocking)."""
+    _sec_rate_limiter.acquire()
+    return company.get_facts()
+
+
+def _padded_cik(company: Any) -> str:
+    """Return a company's CIK zero-padded to EDGAR's 10 digits ('' if unknown)."""
+    return str(company.cik).zfill(10) if hasattr(company, 'cik') else ''
+
+
+def _form_filter(report_type: str) -> Dict[str, str]:
+    """Return the get_filings() keyword arguments selecting ``report_type``."""
+    return {} if report_type == 'all' else {'form': report_type}
+
+
+@lru_cache(maxsize=1024)
+def _company_filings(ticker: str, report_type: str):
+    """Return a company's filings of ``report_type`` ('all' for every form) (blocking)."""
+    company = _company(ticker)
+    _sec_rate_limiter.acquire()
+    return company.get_filings(**_form_filter(report_type))
+
 
 class SECClient:
     """Client for interacting with SEC EDGAR API using edgartools."""
     
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, cache: Optional[CacheManager] = None):
         self.config = config
-        self.cache = CacheManager(config)
+        # A cache passed in is shared with other components and closed by its owner
+        self._owns_cache = cache is None
+        self.cache = cache if cache is not None else CacheManager(config)
+        # Freshly fetched reports waiting for flush_deferred_cache()
+        self._deferred_reports: List[Tuple[str, str, List[Dict]]] = []
+        # Bounds concurrent filing downloads across all of this client's calls
+        self._download_semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+        # Pace EDGAR requests to the configured interval between them
+        interval = config.sec_api_rate_limit
+        _sec_rate_limiter.configure(1 / interval if interval > 0 else 0)
         # Set user agent for edgartools - this is required
         set_identity(config.user_agent)
     
@@ -25,6 +222,16 @@ class SECClient:
         """Initialize the SEC client and cache."""
         await self.cache.initialize()
     
+    async def close(self):
+        """Release the SEC client's cache connection if it owns it."""
+        if self._owns_cache:
+            await self.cache.close()
+    
+    async def flush_deferred_cache(self):
+        """Write reports fetched with ``defer_cache_write`` in one transaction."""
+        entries, self._deferred_reports = self._deferred_reports, []
+        await self.cache.cache_reports_bulk(entries)
+    
     async def get_company_cik(self, ticker: str) -> Optional[str]:
         """Get CIK (Central Index Key) for a company ticker using edgartools."""
         # Try cache first
@@ -33,10 +240,10 @@ class SECClient:
             return cached_cik
         
         try:
-            # Use edgartools to get company
-            company = Company(ticker)
+            # Use edgartools to get company; the lookup blocks on HTTP
+            company = await asyncio.to_thread(_company, ticker.upper())
             if company and hasattr(company, 'cik'):
-                cik = str(company.cik).zfill(10)
+                cik = _padded_cik(company)
                 # Cache the result
                 await self.cache.cache_company_cik(ticker, cik)
                 return cik
@@ -44,189 +251,228 @@ class SECClient:
         except Exception as e:
             raise Exception(f"Error fetching CIK for {ticker}: {e}")
     
-    async def get_company_reports(self, ticker: str, report_type: str = '10-K') -> List[Dict]:
-        """Fetch SEC reports for a company using edgartools."""
+    async def get_ciks(self, tickers: List[str]) -> List[Union[Optional[str], Exception]]:
+        """Get CIKs for many tickers concurrently.
+        
+        Results are in ticker order; a lookup that failed is returned as its
+        exception instead of aborting the batch.
+        """
+        return await self.gather_tickers(tickers, self.get_company_cik)
+    
+    async def get_reports_batch(self, tickers: List[str], report_type: str = '10-K') -> List[Union[List[Dict], Exception]]:
+        """Fetch SEC reports for many tickers concurrently.
+        
+        Results are in ticker order; a fetch that failed is returned as its
+        exception instead of aborting the batch.
+        """
+        return await self.gather_tickers(tickers, lambda ticker: self.get_company_reports(ticker, report_type))
+    
+    async def gather_tickers(self, tickers: List[str], fetch: Callable[[str], Awaitable[Any]]) -> List[Any]:
+        """Run ``fetch`` for each ticker with bounded concurrency.
+        
+        Results are in ticker order, with failures returned as exceptions.
+        """
+        semaphore = asyncio.Semaphore(min(len(tickers), MAX_CONCURRENT_TICKERS) or 1)
+        
+        async def fetch_one(ticker: str):
+            async with semaphore:
+                return await fetch(ticker)
+        
+        return await asyncio.gather(*(fetch_one(ticker) for ticker in tickers), return_exceptions=True)
+    
+    async def get_company_reports(self, ticker: str, report_type: str = '10-K',
+                                  defer_cache_write: bool = False) -> List[Dict]:
+        """Fetch SEC reports for a company using edgartools.
+        
+        With ``defer_cache_write`` freshly fetched reports are queued instead of
+        cached immediately; call ``flush_deferred_cache()`` to write them.
+        """
         # Try cache first
         cached_reports = await self.cache.get_filing_metadata(ticker, report_type)
         if cached_reports:
             return cached_reports
         
         try:
-            # Get company using edgartools
-            company = Company(ticker)
-            if not company:
-                raise Exception(f"Could not find company for ticker {ticker}")
+            # edgartools lookups block on HTTP, so run them off the event loop
+            company, filings = await asyncio.to_thread(self._fetch_filings, ticker, report_type)
             
-            # Get filings of specified type with error handling
-            try:
-                if report_type == 'all':
-                    filings = company.get_filings()
-                else:
-                    filings = company.get_filings(form=report_type)
-            except Exception as e:
-                # If there's an issue with get_filings, try alternative approach
-                print(f"Warning: Error with get_filings: {e}")
-                # Try using the global get_filings function instead
-                from edgar import get_filings
-                try:
-                    if report_type == 'all':
-                        filings = get_filings(ticker=ticker)
-                    else:
-                        filings = get_filings(ticker=ticker, form=report_type)
-                except Exception as e2:
-                    raise Exception(f"Could not fetch filings using alternative method: {e2}")
-            
-            reports = []
-            filing_count = 0
             max_filings = 3
             
-            # Convert filings to list if it's not already
+            # Take only the filings used; edgartools builds a Filing object per
+            # row iterated, so the full list is never walked
             if hasattr(filings, '__iter__'):
-                filings_list = list(filings)
+                filings_iter = islice(filings, max_filings)
             else:
-                filings_list = [filings]
+                filings_iter = iter([filings])
             
-            for filing in filings_list:
-                if filing_count >= max_filings:
-                    break
-                    
-                try:
-                    # Get filing content
-                    content = self._extract_filing_content(filing)
-                    
-                    # Handle potential pyarrow issues by converting attributes safely
-                    filing_date = None
-                    if hasattr(filing, 'filing_date'):
-                        try:
-                            if hasattr(filing.filing_date, 'as_py'):
-                                filing_date = filing.filing_date.as_py().strftime('%Y-%m-%d')
-                            elif hasattr(filing.filing_date, 'strftime'):
-                                filing_date = filing.filing_date.strftime('%Y-%m-%d')
-                            else:
-                                filing_date = str(filing.filing_date)
-                        except Exception:
-                            filing_date = str(filing.filing_date) if filing.filing_date else None
-                    
-                    # Safely get form type
-                    form_type = getattr(filing, 'form', report_type)
-                    if hasattr(form_type, 'as_py'):
-                        try:
-                            form_type = form_type.as_py()
-                        except Exception:
-                            form_type = str(form_type)
-                    
-                    # Safely get accession number
-                    accession_number = getattr(filing, 'accession_number', '')
-                    if hasattr(accession_number, 'as_py'):
-                        try:
-                            accession_number = accession_number.as_py()
-                        except Exception:
-                            accession_number = str(accession_number)
-                    
-                    report = {
-                        'ticker': ticker.upper(),
-                        'cik': str(company.cik).zfill(10) if hasattr(company, 'cik') else '',
-                        'form_type': str(form_type),
-                        'filing_date': filing_date,
-                        'accession_number': str(accession_number),
-                        'primary_document': str(getattr(filing, 'primary_document', '')),
-                        'content': content
-                    }
-                    reports.append(report)
-                    filing_count += 1
-                    
-                except Exception as e:
-                    # Continue with other filings if one fails
-                    print(f"Error processing filing: {e}")
-                    continue
+            # Download the filings concurrently; failed ones come back as None
+            cik = _padded_cik(company)
+            built = await asyncio.gather(*(
+                self._build_report(filing, ticker, cik, report_type, cache_content=not defer_cache_write)
+                for filing in filings_iter
+            ))
+            reports = [report for report in built if report is not None]
             
             if not reports:
                 raise Exception(f"No valid filings found for {ticker}")
             
             # Cache the reports
-            await self.cache.cache_filing_metadata(ticker, report_type, reports)
+            if defer_cache_write:
+                self._deferred_reports.append((ticker, report_type, reports))
+            else:
+                await self.cache.cache_filing_metadata(ticker, report_type, reports)
             return reports
             
         except Exception as e:
             raise Exception(f"Error fetching reports for {ticker}: {e}")
     
-    def _extract_filing_content(self, filing: Filing) -> str:
-        """Extract meaningful content from a filing."""
+    async def _build_report(self, filing: Filing, ticker: str, cik: str, report_type: str,
+                            cache_content: bool = True) -> Optional[Dict]:
+        """Fetch one filing's content and assemble its report dict."""
         try:
-            # Try to get the text content
-            if hasattr(filing, 'text') and callable(filing.text):
-                content = filing.text()
-                if content:
-                    # Limit content length
-                    return content[:self.config.max_report_length]
+            # Filing attributes may be pyarrow scalars
+            filing_date = _fmt_date(getattr(filing, 'filing_date', None))
+            form_type = _unwrap_arrow(getattr(filing, 'form', report_type))
+            accession_number = str(_unwrap_arrow(getattr(filing, 'accession_number', '')))
+            primary_document = str(getattr(filing, 'primary_document', ''))
             
-            # Fallback to HTML content if available
-            if hasattr(filing, 'html') and callable(filing.html):
-                html_content = filing.html()
-                if html_content:
-                    # Simple text extraction from HTML
-                    import re
-                    text = re.sub(r'<[^>]+>', ' ', str(html_content))
-                    text = re.sub(r'\s+', ' ', text).strip()
-                    return text[:self.config.max_report_length]
+            content, content_available = await self._extract_filing_content(
+                filing, cik, accession_number, primary_document, cache_content
+            )
             
-            # If no content available, return basic info
-            return f"Filing {filing.form} for {filing.accession_number} - Content extraction not available"
+            return {
+                'ticker': ticker.upper(),
+                'cik': cik,
+                'form_type': str(form_type),
+                'filing_date': filing_date,
+                'accession_number': accession_number,
+                'primary_document': primary_document,
+                'content': content,
+                # False when content is an error or placeholder message, which
+                # must not be cached as the filing's text
+                'content_available': content_available
+            }
             
         except Exception as e:
-            return f"Error extracting content from filing: {e}"
+            # Other filings are still used if one fails
+            print(f"Error processing filing: {e}")
+            return None
+    
+    def _fetch_filings(self, ticker: str, report_type: str):
+        """Look up a company and its filings of ``report_type`` (blocking)."""
+        # Get company using edgartools
+        company = _company(ticker.upper())
+        if not company:
+            raise Exception(f"Could not find company for ticker {ticker}")
+        
+        # Get filings of specified type with error handling
+        try:
+            filings = _company_filings(ticker.upper(), report_type)
+        except Exception as e:
+            # If there's an issue with get_filings, try alternative approach
+            print(f"Warning: Error with get_filings: {e}")
+            # Try using the global get_filings function instead
+            try:
+                _sec_rate_limiter.acquire()
+                filings = get_filings(ticker=ticker, **_form_filter(report_type))
+            except Exception as e2:
+                raise Exception(f"Could not fetch filings using alternative method: {e2}")
+        
+        return company, filings
+    
+    async def _extract_filing_content(self, filing: Filing, cik: str, accession_number: str,
+                                      primary_document: str, cache_content: bool = True) -> Tuple[str, bool]:
+        """Extract meaningful content from a filing.
+        
+        Returns the content and whether it is the filing's text; when the
+        download fails or has no text, the content is a message instead.
+        
+        Published filings never change, so text cached under the accession
+        number is reused instead of downloading the filing again. Fresh text
+        is cached unless ``cache_content`` is False (deferred writes cache it
+        with the rest of the report).
+        """
+        if accession_number:
+            cached = await self.cache.get_document_content(cik, accession_number, primary_document)
+            if cached is not None:
+                return cached[:self.config.max_report_length], True
+        
+        try:
+            # The download is blocking, so it runs in a worker thread, with
+            # the number in flight bounded per client
+            async with self._download_semaphore:
+                content = await asyncio.to_thread(self._download_filing_text, filing)
+        except Exception as e:
+            return f"Error extracting content from filing: {e}", False
+        
+        if content is None:
+            # If no content available, return basic info
+            return f"Filing {filing.form} for {filing.accession_number} - Content extraction not available", False
+        
+        if cache_content and accession_number:
+            await self.cache.cache_document_content(cik, accession_number, primary_document, content)
+        return content, True
+    
+    def _download_filing_text(self, filing: Filing) -> Optional[str]:
+        """Download a filing's text, truncated to max_report_length (blocking)."""
+        # Try to get the text content
+        if hasattr(filing, 'text') and callable(filing.text):
+            _sec_rate_limiter.acquire()
+            content = filing.text()
+            if content:
+                # Limit content length
+                return content[:self.config.max_report_length]
+        
+        # Fallback to HTML content if available
+        if hasattr(filing, 'html') and callable(filing.html):
+            _sec_rate_limiter.acquire()
+            html_content = filing.html()
+            if html_content:
+                return _html_to_text(str(html_content), self.config.max_report_length)
+        
+        return None
     
     async def get_recent_filings(self, ticker: str, limit: int = 5) -> List[Dict]:
         """Get recent filings for a company using edgartools."""
         try:
-            company = Company(ticker)
+            company = await asyncio.to_thread(_company, ticker.upper())
             if not company:
                 raise Exception(f"Could not find company for ticker {ticker}")
             
-            filings = company.get_filings()
+            filings = await asyncio.to_thread(_company_filings, ticker.upper(), 'all')
+            
+            columns = _filing_columns(filings, limit)
+            if columns is not None:
+                return [
+                    {
+                        'date': _fmt_date(filing_date),
+                        'form_type': str(form_type),
+                        'description': f"{form_type} Filing",
+                        # Filing objects have no filing_details_url either, so
+                        # the per-filing path below also reports ''
+                        'url': '',
+                        'accession_number': str(accession_number)
+                    }
+                    for form_type, filing_date, accession_number in zip(*columns)
+                ]
             
             results = []
             filing_count = 0
             
-            # Convert filings to list if it's not already
-            if hasattr(filings, '__iter__'):
-                filings_list = list(filings)
-            else:
-                filings_list = [filings]
+            # Iterate lazily so only the filings read are converted; failed
+            # ones don't count towards the limit, so islice can't bound this
+            if not hasattr(filings, '__iter__'):
+                filings = [filings]
             
-            for filing in filings_list:
+            for filing in filings:
                 if filing_count >= limit:
                     break
                     
                 try:
-                    # Handle potential pyarrow issues
-                    filing_date = None
-                    if hasattr(filing, 'filing_date'):
-                        try:
-                            if hasattr(filing.filing_date, 'as_py'):
-                                filing_date = filing.filing_date.as_py().strftime('%Y-%m-%d')
-                            elif hasattr(filing.filing_date, 'strftime'):
-                                filing_date = filing.filing_date.strftime('%Y-%m-%d')
-                            else:
-                                filing_date = str(filing.filing_date)
-                        except Exception:
-                            filing_date = str(filing.filing_date) if filing.filing_date else None
-                    
-                    # Safely get form type
-                    form_type = getattr(filing, 'form', '')
-                    if hasattr(form_type, 'as_py'):
-                        try:
-                            form_type = form_type.as_py()
-                        except Exception:
-                            form_type = str(form_type)
-                    
-                    # Safely get accession number
-                    accession_number = getattr(filing, 'accession_number', '')
-                    if hasattr(accession_number, 'as_py'):
-                        try:
-                            accession_number = accession_number.as_py()
-                        except Exception:
-                            accession_number = str(accession_number)
+                    # Filing attributes may be pyarrow scalars
+                    filing_date = _fmt_date(getattr(filing, 'filing_date', None))
+                    form_type = _unwrap_arrow(getattr(filing, 'form', ''))
+                    accession_number = _unwrap_arrow(getattr(filing, 'accession_number', ''))
                     
                     results.append({
                         'date': filing_date,
@@ -249,19 +495,20 @@ class SECClient:
     async def get_company_facts(self, ticker: str) -> Dict:
         """Get company facts using edgartools."""
         try:
-            company = Company(ticker)
+            company = await asyncio.to_thread(_company, ticker.upper())
             if not company:
                 raise Exception(f"Could not find company for ticker {ticker}")
             
-            # Get company facts if available
+            # Get company facts if available; the XBRL facts download blocks
+            # on HTTP too, so it also runs off the event loop
             if hasattr(company, 'get_facts'):
-                facts = company.get_facts()
+                facts = await asyncio.to_thread(_company_facts, company)
                 return facts
             
             # Fallback to basic company info
             return {
                 'name': getattr(company, 'name', ''),
-                'cik': str(company.cik).zfill(10) if hasattr(company, 'cik') else '',
+                'cik': _padded_cik(company),
                 'ticker': ticker.upper(),
                 'sic': getattr(company, 'sic', ''),
                 'industry': getattr(company, 'industry', '')